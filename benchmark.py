@@ -0,0 +1,512 @@
+"""End-to-end pipeline benchmark on synthetic Keyword Planner exports.
+
+Example:
+    python benchmark.py --sizes 1000 10000 --llm-latency 0.2 --output bench.json
+    python benchmark.py --sizes 1000 10000 --update-baseline
+
+Each size runs in its own interpreter with empty caches, so runs are
+repeatable and peak memory belongs to that size alone. Labeling talks to
+``fake_openai`` with the given latency, so no API key or network is
+needed. Wall time, CPU time, peak RSS and throughput are recorded per
+stage. They are compared with ``benchmark_baseline.json`` when it exists,
+and the exit status is 1 if any stage got slower than the tolerance.
+
+``--clustering`` skips the pipeline and times ``size_constrained_clusters``
+alone on random, duplicate-heavy and all-identical embeddings, failing if
+any case takes longer than ``--clustering-budget`` seconds.
+
+``--workers 0 2 4`` repeats every size with that many inference worker
+processes (see ``workers.py``); 0 keeps inference in-process. Runs with
+workers are stored as ``"<rows>/<n> workers"`` next to the plain sizes.
+
+``--filters`` times the Aho-Corasick pattern filter against the regex
+``str.contains`` it replaced, for growing numbers of filter terms.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_BASELINE = "benchmark_baseline.json"
+SEED = 1234
+
+MODIFIERS = [
+    "best", "cheap", "emergency", "local", "affordable", "24 hour", "same day",
+    "trusted", "professional", "certified", "nearby", "top rated", "commercial",
+    "residential", "fast", "reliable", "licensed", "expert", "budget", "premium",
+]
+SERVICES = [
+    "plumber", "boiler repair", "boiler installation", "drain unblocking",
+    "leak detection", "bathroom fitting", "kitchen fitting", "radiator repair",
+    "central heating", "water heater repair", "electrician", "rewiring",
+    "fuse box replacement", "roofer", "gutter cleaning", "locksmith",
+    "window repair", "damp proofing", "heat pump installation", "gas safety check",
+    "tap replacement", "toilet repair", "shower installation", "pipe repair",
+]
+LOCATIONS = [
+    "london", "manchester", "leeds", "bristol", "birmingham", "glasgow",
+    "liverpool", "sheffield", "cardiff", "edinburgh", "nottingham", "leicester",
+    "near me", "in my area", "open now", "uk",
+]
+SUFFIXES = ["", "", "", "cost", "prices", "quote", "services", "company", "reviews"]
+QUESTION_STARTS = [
+    "how much is a", "what is a", "why is my", "can i get a", "do i need a",
+]
+FILTER_WORDS = ["free", "help", "download"]
+
+COLUMNS = [
+    "Keyword",
+    "Currency",
+    "Avg. monthly searches",
+    "Three month change",
+    "YoY change",
+    "Competition",
+    "Competition (indexed value)",
+    "Top of page bid (low range)",
+    "Top of page bid (high range)",
+    "Searches: Jan 2025",
+    "Searches: Feb 2025",
+    "Searches: Mar 2025",
+    "Searches: Apr 2025",
+]
+
+
+def _keyword(rng):
+    roll = rng.random()
+    if roll < 0.08:
+        base = f"{rng.choice(QUESTION_STARTS)} {rng.choice(SERVICES)}"
+    else:
+        parts = [rng.choice(MODIFIERS), rng.choice(SERVICES), rng.choice(LOCATIONS)]
+        base = " ".join(parts)
+    suffix = rng.choice(SUFFIXES)
+    if suffix:
+        base = f"{base} {suffix}"
+    if roll > 0.97:
+        base = f"{base} {rng.choice(FILTER_WORDS)}"
+    # Case and spacing variants exercise canonical deduplication
+    if rng.random() < 0.05:
+        base = base.title() if rng.random() < 0.5 else base.replace(" ", "  ", 1)
+    return base
+
+
+def generate_keyword_csv(path, rows, seed=SEED):
+    """Write ``rows`` synthetic keywords as a UTF-16 Keyword Planner export."""
+    import pandas as pd
+
+    rng = random.Random(seed)
+    keywords = [_keyword(rng) for _ in range(rows)]
+    # Unique-ish long tail: numbered variants once the combinations run out
+    seen = {}
+    for i, keyword in enumerate(keywords):
+        count = seen.get(keyword, 0)
+        seen[keyword] = count + 1
+        if count >= 3:
+            keywords[i] = f"{keyword} {count}"
+    volumes = [10, 20, 50, 90, 140, 260, 480, 880, 1600]
+    searches = [rng.choice(volumes) for _ in keywords]
+    low_bids = [round(rng.uniform(0.2, 4.0), 2) for _ in keywords]
+    df = pd.DataFrame(
+        {
+            "Keyword": keywords,
+            "Currency": "GBP",
+            "Avg. monthly searches": searches,
+            "Three month change": "0%",
+            "YoY change": "0%",
+            "Competition": [rng.choice(["Low", "Medium", "High"]) for _ in keywords],
+            "Competition (indexed value)": [rng.randint(0, 100) for _ in keywords],
+            "Top of page bid (low range)": low_bids,
+            "Top of page bid (high range)": [
+                round(b * rng.uniform(1.5, 4.0), 2) for b in low_bids
+            ],
+        }
+    )
+    for column in COLUMNS[9:]:
+        df[column] = [max(0, int(s * rng.uniform(0.5, 1.5))) for s in searches]
+    with open(path, "w", encoding="utf-16", newline="") as f:
+        f.write("Keyword Stats 2025-05-01 at 09_00_00\n")
+        f.write("1 January 2025 - 30 April 2025\n")
+        df[COLUMNS].to_csv(f, sep="\t", index=False)
+    return path
+
+
+def _rows(value):
+    if isinstance(value, tuple):
+        value = value[0]
+    return len(value) if hasattr(value, "__len__") else None
+
+
+def _timed(timings, name, rows_in, fn, *args, **kwargs):
+    from metrics import PeakRSS
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    with PeakRSS() as rss:
+        result = fn(*args, **kwargs)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    timings[name] = {
+        "seconds": round(wall, 4),
+        "cpu_seconds": round(cpu, 4),
+        "peak_rss_mb": round(rss.peak, 1),
+        "rows_in": rows_in,
+        "rows_out": _rows(result),
+        "rows_per_second": round(rows_in / wall, 1) if wall > 0 else None,
+    }
+    print(f"⏱️ {name}: {wall:.2f}s, {timings[name]['rows_per_second']} rows/s")
+    return result
+
+
+def run_one(csv_path, rows, min_k, max_k, llm_latency):
+    """Time every stage on one generated file; run in a fresh interpreter."""
+    from fake_openai import start_fake_server
+
+    server, base_url = start_fake_server(latency=llm_latency)
+    os.environ["OPENAI_API_BASE"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+    from models import warm_up_models
+    from normalize import add_canonical_keywords
+    from processor import (
+        load_and_clean_file,
+        filter_questions,
+        filter_patterns,
+        embed_keywords,
+        cluster_keywords,
+    )
+    from intent import label_all_clusters
+    from progress import LogProgress
+    from sentiment_helper import assign_cluster_sentiment
+    from utils import export_data_to_excel
+
+    start = time.perf_counter()
+    warm_up_models(background=False)
+    model_load = round(time.perf_counter() - start, 2)
+
+    t = {}
+    df = _timed(t, "load_and_clean_file", rows, load_and_clean_file, csv_path)
+    df = _timed(t, "normalize", len(df), add_canonical_keywords, df)
+    df, removed_q = _timed(t, "filter_questions", len(df), filter_questions, df)
+    df, removed_p = _timed(
+        t, "filter_patterns", len(df), filter_patterns, df, FILTER_WORDS
+    )
+    embeddings = _timed(t, "embed_keywords", len(df), embed_keywords, df)
+    df_clustered, embeddings, centers, df_misc = _timed(
+        t,
+        "cluster_keywords",
+        len(df),
+        cluster_keywords,
+        df,
+        min_k,
+        max_k,
+        embeddings=embeddings,
+    )
+    df_labeled = _timed(
+        t,
+        "label_all_clusters",
+        len(df_clustered),
+        label_all_clusters,
+        df_clustered,
+        embeddings,
+        centers,
+        progress=LogProgress(stage="labeling", stream=None),
+    )
+    df_labeled = _timed(
+        t,
+        "assign_cluster_sentiment",
+        len(df_labeled),
+        assign_cluster_sentiment,
+        df_labeled,
+        "Users seeking professional help or services",
+        "Users expressing problems, issues, or confusion",
+    )
+    sheets = {
+        "Final_Clustered_Keywords": df_labeled,
+        "Removed_Questions": removed_q,
+        "Removed_Patterns": removed_p,
+        "Cleaned_Keywords": df,
+    }
+    fd, xlsx_path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        _timed(
+            t,
+            "export_data_to_excel",
+            sum(len(s) for s in sheets.values()) + len(df_misc),
+            export_data_to_excel,
+            sheets,
+            "benchmark.xlsx",
+            max_k=max_k,
+            misc_df=df_misc,
+            output=xlsx_path,
+        )
+    finally:
+        os.remove(xlsx_path)
+    server.shutdown()
+
+    total = sum(stage["seconds"] for stage in t.values())
+    return {
+        "rows": rows,
+        "model_load_seconds": model_load,
+        "total_seconds": round(total, 3),
+        "rows_per_second": round(rows / total, 1) if total > 0 else None,
+        "peak_rss_mb": max(stage["peak_rss_mb"] for stage in t.values()),
+        "clusters": int(df_labeled["Cluster"].nunique()) if len(df_labeled) else 0,
+        "stages": t,
+    }
+
+
+def _embedding_cases(rows, dim=384, seed=SEED):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(1, rows // 50), dim)).astype(np.float32)
+    spread = centres[rng.integers(0, len(centres), rows)]
+    spread += 0.1 * rng.standard_normal((rows, dim)).astype(np.float32)
+    duplicated = spread.copy()
+    duplicated[: int(rows * 0.8)] = spread[0]
+    identical = np.repeat(spread[:1], rows, axis=0)
+    return {"spread": spread, "80% duplicates": duplicated, "identical": identical}
+
+
+def clustering_check(sizes, min_k, max_k, budget):
+    """Time the clustering step alone; returns the cases over ``budget``."""
+    from clustering import size_constrained_clusters
+
+    slow = []
+    for rows in sizes:
+        for case, embeddings in _embedding_cases(rows).items():
+            start = time.perf_counter()
+            groups, misc = size_constrained_clusters(embeddings, min_k, max_k)
+            seconds = time.perf_counter() - start
+            print(
+                f"⏱️ clustering {rows} rows ({case}): {seconds:.2f}s, "
+                f"{len(groups)} groups, {len(misc)} misc"
+            )
+            if seconds > budget:
+                slow.append((rows, case, seconds))
+    return slow
+
+
+def filter_comparison(sizes, term_counts=(3, 100, 1000), seed=SEED):
+    """Time ``match_many`` against an escaped-alternation ``str.contains``."""
+    import re
+
+    import pandas as pd
+
+    from pattern_filter import KeywordMatcher
+
+    rng = random.Random(seed)
+    vocabulary = sorted({w for k in (MODIFIERS + SERVICES) for w in k.split()})
+    results = {}
+    for rows in sizes:
+        keywords = pd.Series([_keyword(rng) for _ in range(rows)])
+        for count in term_counts:
+            terms = FILTER_WORDS + [
+                f"{rng.choice(vocabulary)} {rng.randrange(10**6)}"
+                for _ in range(max(0, count - len(FILTER_WORDS)))
+            ]
+            start = time.perf_counter()
+            matched = KeywordMatcher(terms).match_many(keywords.tolist())
+            automaton = time.perf_counter() - start
+
+            start = time.perf_counter()
+            pattern = "|".join(re.escape(t) for t in terms)
+            regex = keywords.str.contains(pattern, case=False, regex=True)
+            baseline = time.perf_counter() - start
+
+            if sum(m is not None for m in matched) != int(regex.sum()):
+                raise AssertionError(f"Filters disagree at {rows} rows, {count} terms")
+            results[f"{rows}x{count}"] = {
+                "automaton_seconds": round(automaton, 4),
+                "regex_seconds": round(baseline, 4),
+            }
+            print(
+                f"⏱️ filter {rows} rows × {count} terms: "
+                f"automaton {automaton:.2f}s, regex {baseline:.2f}s"
+            )
+    return results
+
+
+def run_size(rows, args, workdir, workers=0):
+    """Generate one corpus and benchmark it in a child interpreter."""
+    csv_path = os.path.join(workdir, f"keywords_{rows}.csv")
+    if not os.path.exists(csv_path):
+        generate_keyword_csv(csv_path, rows)
+    env = dict(os.environ)
+    # Empty caches per size so every run does the same work
+    cache_dir = tempfile.mkdtemp(prefix=f"cache_{rows}_", dir=workdir)
+    env.update(
+        {
+            "KEYWORD_EMBEDDING_CACHE_DIR": os.path.join(cache_dir, "embeddings"),
+            "KEYWORD_LABEL_CACHE": os.path.join(cache_dir, "labels.sqlite3"),
+            "KEYWORD_CENTROID_INDEX_DIR": os.path.join(cache_dir, "centroids"),
+            "OPENAI_REQUESTS_PER_MINUTE": "1000000",
+            "OPENAI_TOKENS_PER_MINUTE": "1000000000",
+            "KEYWORD_WORKERS": str(workers),
+        }
+    )
+    result_path = os.path.join(workdir, f"result_{rows}_{workers}.json")
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--run-one",
+        csv_path,
+        "--rows",
+        str(rows),
+        "--min-k",
+        str(args.min_k),
+        "--max-k",
+        str(args.max_k),
+        "--llm-latency",
+        str(args.llm_latency),
+        "--result",
+        result_path,
+    ]
+    subprocess.run(command, env=env, check=True)
+    with open(result_path, encoding="utf-8") as f:
+        result = json.load(f)
+    result["workers"] = workers
+    return result
+
+
+def _size_key(rows, workers):
+    return str(rows) if workers <= 1 else f"{rows}/{workers} workers"
+
+
+def compare(results, baseline, tolerance, min_seconds):
+    """Return a list of ``(size, stage, seconds, baseline_seconds)`` regressions."""
+    regressions = []
+    for size, run in results["sizes"].items():
+        base_run = baseline.get("sizes", {}).get(size)
+        if base_run is None:
+            continue
+        for stage, timing in run["stages"].items():
+            base = base_run["stages"].get(stage)
+            if base is None:
+                continue
+            slower = timing["seconds"] - base["seconds"]
+            if slower > min_seconds and timing["seconds"] > base["seconds"] * (
+                1 + tolerance
+            ):
+                regressions.append((size, stage, timing["seconds"], base["seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--min-k", type=int, default=5)
+    parser.add_argument("--max-k", type=int, default=20)
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.2, help="fake OpenAI seconds per call"
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%"
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.05,
+        help="ignore slowdowns smaller than this",
+    )
+    parser.add_argument("--workdir", help="keep generated CSVs here between runs")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[0],
+        help="inference worker counts to compare",
+    )
+    parser.add_argument(
+        "--clustering", action="store_true", help="time only the clustering step"
+    )
+    parser.add_argument("--clustering-budget", type=float, default=60.0)
+    parser.add_argument(
+        "--filters", action="store_true", help="compare pattern filter with regex"
+    )
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    parser.add_argument("--rows", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        result = run_one(
+            args.run_one, args.rows, args.min_k, args.max_k, args.llm_latency
+        )
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    if args.clustering:
+        slow = clustering_check(
+            args.sizes, args.min_k, args.max_k, args.clustering_budget
+        )
+        for rows, case, seconds in slow:
+            print(f"❌ clustering {rows} rows ({case}) took {seconds:.2f}s")
+        return 1 if slow else 0
+
+    if args.filters:
+        filter_comparison(args.sizes)
+        return 0
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="keyword_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "llm_latency": args.llm_latency,
+            "min_k": args.min_k,
+            "max_k": args.max_k,
+            "seed": SEED,
+            "workers": args.workers,
+        },
+        "sizes": {},
+    }
+    for rows in args.sizes:
+        first = None
+        for workers in args.workers:
+            print(f"🏁 Benchmarking {rows} rows, {workers} workers")
+            result = run_size(rows, args, workdir, workers)
+            results["sizes"][_size_key(rows, workers)] = result
+            first = first or result
+            if result is not first:
+                print(
+                    f"📈 {workers} workers: {result['total_seconds']:.2f}s vs "
+                    f"{first['total_seconds']:.2f}s with {args.workers[0]}"
+                )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"📄 Wrote {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"📌 Baseline updated: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️ No baseline at {args.baseline}; run with --update-baseline")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+    for size, stage, seconds, base in regressions:
+        print(f"❌ {size} rows / {stage}: {seconds:.2f}s vs {base:.2f}s baseline")
+    if not regressions:
+        print("✅ No regressions against the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
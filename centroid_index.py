@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+from clustering import normalize_rows
+
+DEFAULT_INDEX_DIR = os.environ.get(
+    "KEYWORD_CENTROID_INDEX_DIR", os.path.join(".cache", "centroids")
+)
+DEFAULT_THRESHOLD = float(os.environ.get("KEYWORD_LABEL_REUSE_THRESHOLD", 0.92))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("KEYWORD_CENTROID_INDEX_MAX", 200_000))
+# New centroids this close to a stored one only refresh that entry
+DEDUP_THRESHOLD = 0.99
+
+
+class CentroidIndex:
+    """Past cluster centroids and the intent labels they were given.
+
+    Centroids are unit-normalized rows of a memory-mapped float32 matrix
+    (``centroids.f32``); ``labels.json`` holds the label and last-used time
+    of each row. Near-duplicates of stored centroids are not added again,
+    and past ``max_entries`` the least recently used rows are dropped and
+    the matrix is compacted, as in ``label_cache``.
+
+    The app, the CLI and job processes share one directory, so every read
+    and write holds a ``flock`` on ``lock`` and reloads ``labels.json`` first
+    if another process rewrote it, as ``embedding_cache`` does.
+    """
+
+    def __init__(self, name, index_dir=DEFAULT_INDEX_DIR, max_entries=None):
+        self.path = os.path.join(index_dir, name.replace("/", "__"))
+        self.max_entries = max_entries or DEFAULT_MAX_ENTRIES
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        with self._file_lock(shared=True):
+            self._load()
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, "lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _labels_mtime(self):
+        try:
+            st = os.stat(self._labels_file)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _load(self):
+        self.labels = []
+        self.last_used = []
+        self.dim = None
+        self.matrix = None
+        self._loaded_mtime = self._labels_mtime()
+        if self._loaded_mtime is None:
+            return
+        with open(self._labels_file) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.labels = [tuple(label) for label in meta["labels"]]
+        now = time.time()
+        self.last_used = meta.get("last_used") or [now] * len(self.labels)
+        self._open_matrix()
+
+    def _refresh(self):
+        """Reload if another process rewrote the index; keeps newer uses."""
+        if self._labels_mtime() == self._loaded_mtime:
+            return
+        labels, last_used = self.labels, self.last_used
+        self._load()
+        for i in range(min(len(labels), len(self.labels))):
+            if labels[i] == self.labels[i] and last_used[i] > self.last_used[i]:
+                self.last_used[i] = last_used[i]
+
+    @property
+    def _matrix_file(self):
+        return os.path.join(self.path, "centroids.f32")
+
+    @property
+    def _labels_file(self):
+        return os.path.join(self.path, "labels.json")
+
+    def _open_matrix(self):
+        if not self.labels:
+            self.matrix = None
+            return
+        self.matrix = np.memmap(
+            self._matrix_file,
+            dtype=np.float32,
+            mode="r",
+            shape=(len(self.labels), self.dim),
+        )
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _best_matches(self, centroids, block_size):
+        best_sim = np.full(len(centroids), -np.inf, dtype=np.float32)
+        best_row = np.zeros(len(centroids), dtype=np.int64)
+        if self.matrix is None or len(centroids) == 0:
+            return best_sim, best_row
+        # Scan stored centroids in blocks so memory stays bounded
+        for start in range(0, len(self.labels), block_size):
+            block = np.asarray(self.matrix[start: start + block_size])
+            sims = centroids @ block.T
+            row = sims.argmax(axis=1)
+            sim = sims[np.arange(len(centroids)), row]
+            better = sim > best_sim
+            best_sim[better] = sim[better]
+            best_row[better] = row[better] + start
+        return best_sim, best_row
+
+    def query(self, centroids, threshold=DEFAULT_THRESHOLD, block_size=4096):
+        """Return the stored label for each centroid, or ``None`` below threshold."""
+        centroids = normalize_rows(centroids)
+        matches = [None] * len(centroids)
+        with self._lock, self._file_lock(shared=True):
+            self._refresh()
+            best_sim, best_row = self._best_matches(centroids, block_size)
+            now = time.time()
+            for i in np.flatnonzero(best_sim >= threshold):
+                matches[i] = self.labels[best_row[i]]
+                self.last_used[best_row[i]] = now
+        return matches
+
+    def add(self, centroids, labels, block_size=4096):
+        if len(labels) == 0:
+            return
+        centroids = normalize_rows(centroids)
+        with self._lock, self._file_lock():
+            self._refresh()
+            now = time.time()
+            best_sim, best_row = self._best_matches(centroids, block_size)
+            duplicate = best_sim >= DEDUP_THRESHOLD
+            for row in best_row[duplicate]:
+                self.last_used[row] = now
+            keep = np.flatnonzero(~duplicate)
+            if self.dim is None:
+                self.dim = centroids.shape[1]
+            self.matrix = None
+            if len(keep):
+                with open(self._matrix_file, "ab") as f:
+                    # Drop rows a crashed writer appended but never indexed
+                    f.truncate(len(self.labels) * self.dim * 4)
+                    f.write(centroids[keep].tobytes())
+                self.labels.extend(tuple(labels[i]) for i in keep)
+                self.last_used.extend([now] * len(keep))
+            if len(self.labels) > self.max_entries:
+                self._evict()
+            tmp = self._labels_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(
+                    {
+                        "dim": self.dim,
+                        "labels": self.labels,
+                        "last_used": self.last_used,
+                    },
+                    f,
+                )
+            os.replace(tmp, self._labels_file)
+            self._loaded_mtime = self._labels_mtime()
+            self._open_matrix()
+
+    def _evict(self):
+        order = np.argsort(self.last_used, kind="stable")
+        keep = np.sort(order[len(self.labels) - self.max_entries:])
+        old = np.memmap(
+            self._matrix_file,
+            dtype=np.float32,
+            mode="r",
+            shape=(len(self.labels), self.dim),
+        )
+        compacted = np.asarray(old[keep])
+        del old
+        tmp = self._matrix_file + ".tmp"
+        compacted.tofile(tmp)
+        os.replace(tmp, self._matrix_file)
+        print(f"🧹 Centroid index evicted {len(self.labels) - len(keep)} rows.")
+        self.labels = [self.labels[i] for i in keep]
+        self.last_used = [self.last_used[i] for i in keep]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_centroid_index(name):
+    with _indexes_lock:
+        if name not in _indexes:
+            _indexes[name] = CentroidIndex(name)
+        return _indexes[name]
@@ -0,0 +1,69 @@
+"""Check that the app's start-up imports stay light.
+
+Imports the modules ``main.py`` loads before login in a fresh interpreter
+and fails if any heavy library came along with them or if the imports took
+longer than the budget. Run with ``python check_import_budget.py``.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+STARTUP_MODULES = [
+    "streamlit",
+    "pandas",
+    "users",
+    "models",
+    "processor",
+    "stage_cache",
+    "jobs",
+    "metrics",
+    "embedding_cache",
+    "reports",
+    "utils",
+]
+
+# Loaded on first use only; none of these may be pulled in at start-up
+HEAVY_MODULES = [
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "onnxruntime",
+    "sklearn",
+    "matplotlib",
+    "openai",
+]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+loaded = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy_loaded": loaded}}))
+"""
+
+
+def measure(modules=STARTUP_MODULES, heavy=HEAVY_MODULES):
+    code = _PROBE.format(modules=list(modules), heavy=list(heavy))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"Start-up imports failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=3.0, help="seconds")
+    args = parser.parse_args()
+
+    report = measure()
+    print(f"⏱️ Start-up imports took {report['seconds']:.2f}s")
+    if report["heavy_loaded"]:
+        print(f"❌ Heavy modules imported at start-up: {report['heavy_loaded']}")
+    if report["seconds"] > args.budget:
+        print(f"❌ Over the {args.budget:.1f}s import budget")
+    ok = not report["heavy_loaded"] and report["seconds"] <= args.budget
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,218 @@
+"""Headless batch runner for the keyword pipeline.
+
+Example:
+    OPENAI_API_KEY=... python cli.py exports/*.csv --output-dir reports \\
+        --min-k 5 --max-k 20 --exclude "free, help, download" --log-json run.jsonl
+
+Models are loaded once and reused for every input file. Progress goes to
+stderr and, with ``--log-json``, to a JSON-lines log.
+"""
+
+import argparse
+import glob
+import json
+import os
+import pickle
+import sys
+import time
+
+import pandas as pd
+
+from models import warm_up_models
+from workers import set_worker_count
+from pipeline import run_pipeline, run_incremental, report_frames
+from processor import load_and_clean_file, iter_keyword_batches
+from progress import LogProgress
+from metrics import RunMetrics, activate
+from utils import export_data, EXPORT_FORMATS
+from reports import REPORT_DOWNLOADS
+
+DEFAULT_POSITIVE = "Users seeking professional help or services"
+DEFAULT_NEGATIVE = "Users expressing problems, issues, or confusion"
+
+
+def expand_inputs(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(glob.glob(os.path.join(pattern, "*.csv"))))
+        else:
+            paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return list(dict.fromkeys(paths))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Group keyword files by intent.")
+    parser.add_argument("inputs", nargs="+", help="CSV files, globs or directories")
+    parser.add_argument("--output-dir", default="reports")
+    parser.add_argument("--min-k", type=int, default=5)
+    parser.add_argument("--max-k", type=int, default=20)
+    parser.add_argument(
+        "--exclude",
+        default="free, help, download",
+        help="comma-separated unwanted words",
+    )
+    parser.add_argument("--positive", default=DEFAULT_POSITIVE)
+    parser.add_argument("--negative", default=DEFAULT_NEGATIVE)
+    parser.add_argument("--log-json", help="append JSON-lines progress to this file")
+    parser.add_argument(
+        "--fold-plurals",
+        action="store_true",
+        help="treat singular/plural variants as one keyword",
+    )
+    parser.add_argument(
+        "--refresh-labels",
+        action="store_true",
+        help="ignore cached intent labels and ask the LLM again",
+    )
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="xlsx")
+    parser.add_argument(
+        "--engine", choices=["c", "pyarrow"], default="c", help="CSV parser"
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="read each file in batches of this many rows; every batch after "
+        "the first is added to the grouping so far",
+    )
+    parser.add_argument(
+        "--previous",
+        help="results pickle of an earlier run (--save-run or a job's "
+        "results.pkl); new keywords are added to its groups",
+    )
+    parser.add_argument(
+        "--save-run",
+        action="store_true",
+        help="also write <name>_run.pkl for later --previous runs",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="inference processes (default: $KEYWORD_WORKERS, 0 = in-process)",
+    )
+    args = parser.parse_args(argv)
+    if args.max_k <= args.min_k:
+        parser.error("--max-k must be greater than --min-k")
+    return args
+
+
+def load_previous(path):
+    if os.path.isdir(path):
+        path = os.path.join(path, "results.pkl")
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def process_file(path, args, json_log=None, previous=None):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    run = RunMetrics(f"{stem}-{int(time.time())}")
+    with activate(run):
+        out_path = _process_file(path, args, json_log, previous)
+    if json_log is not None:
+        event = {
+            "time": time.time(),
+            "stage": os.path.basename(path),
+            "event": "metrics",
+            "profile": run.summary(),
+        }
+        json_log.write(json.dumps(event, default=str) + "\n")
+    return out_path
+
+
+def _process_file(path, args, json_log=None, previous=None):
+    log = LogProgress(stage=os.path.basename(path), json_log=json_log)
+    start = time.time()
+    log.update(0.0, "loading")
+    if args.chunksize:
+        batches = iter_keyword_batches(path, args.chunksize, engine=args.engine)
+    else:
+        df = load_and_clean_file(path, engine=args.engine)
+        if df is None:
+            raise ValueError(f"could not read {path}")
+        batches = [df]
+
+    word_list = [w.strip() for w in args.exclude.split(",") if w.strip()]
+    results = previous
+    for number, df in enumerate(batches, start=1):
+        if args.chunksize:
+            log.update(0.0, f"batch {number}: {len(df)} rows")
+        if results is not None:
+            run, extra = run_incremental, (results,)
+        else:
+            run, extra = run_pipeline, ()
+        results = run(
+            df,
+            *extra,
+            word_list,
+            args.min_k,
+            args.max_k,
+            args.positive,
+            args.negative,
+            progress=log,
+            fold_plurals=args.fold_plurals,
+            refresh_labels=args.refresh_labels,
+        )
+    if results is None:
+        raise ValueError(f"no keywords in {path}")
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    out_name = REPORT_DOWNLOADS[args.format][0]
+    out_path = os.path.join(args.output_dir, f"{stem}_{out_name}")
+    # Stream straight to the output file rather than through memory
+    export_data(
+        report_frames(results),
+        fmt=args.format,
+        max_k=args.max_k,
+        misc_df=results.get("misc_keywords", pd.DataFrame()),
+        output=out_path,
+    )
+    if args.save_run:
+        with open(os.path.join(args.output_dir, f"{stem}_run.pkl"), "wb") as f:
+            pickle.dump(results, f, protocol=4)
+    log.finish(
+        f"wrote {out_path}: {len(results['final_df'])} keywords in "
+        f"{results['final_df']['Cluster'].nunique()} groups, "
+        f"{time.time() - start:.1f}s"
+    )
+    return out_path
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    paths = expand_inputs(args.inputs)
+    os.makedirs(args.output_dir, exist_ok=True)
+    json_log = open(args.log_json, "a", encoding="utf-8") if args.log_json else None
+
+    if args.workers is not None:
+        set_worker_count(args.workers)
+    # Load weights once up front; every file reuses the same models
+    warm_up_models(background=False)
+
+    previous = load_previous(args.previous) if args.previous else None
+
+    failures = 0
+    try:
+        for path in paths:
+            try:
+                process_file(path, args, json_log, previous)
+            except Exception as e:
+                failures += 1
+                sys.stderr.write(f"[{os.path.basename(path)}] ❌ failed: {e}\n")
+                if json_log is not None:
+                    event = {
+                        "time": time.time(),
+                        "stage": os.path.basename(path),
+                        "event": "error",
+                        "message": str(e),
+                    }
+                    json_log.write(json.dumps(event) + "\n")
+    finally:
+        if json_log is not None:
+            json_log.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
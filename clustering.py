@@ -0,0 +1,221 @@
+"""Size-constrained keyword clustering.
+
+Groups are produced by recursive bisection: every node larger than
+``max_k`` is split in two with a 2-means fit, and a split that would leave
+either side below ``min_k`` is rebalanced along the axis between the two
+centres. Each level is linear in the number of rows and there are about
+``log2(n / max_k)`` levels, so the whole run is O(n log n). Every split
+keeps at least ``MIN_SPLIT_FRACTION`` of the node on each side, which
+bounds the depth even for skewed data; nodes of identical rows are cut
+into chunks directly, and small nodes are split along their principal
+axis without a 2-means fit.
+
+Memory ceiling: the normalized float32 copy of the embeddings
+(``n * dim * 4`` bytes, ~1.5 GB for 1M x 384) plus, at most, one gathered
+copy of the rows being split at the current level. Budget roughly three
+times the embedding matrix.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Nodes above this size are fitted on a random sample and then predicted
+FIT_SAMPLE_SIZE = 50_000
+# Nodes up to this many times max_k are split along their principal axis
+# instead of fitting 2-means, which dominates the run on the many tiny nodes
+SMALL_NODE_FACTOR = 4
+# Each side of a split keeps at least this share of the node, so skewed
+# data (e.g. many near-duplicates) cannot peel off min_k rows per level
+MIN_SPLIT_FRACTION = 0.1
+
+
+def normalize_rows(matrix):
+    """Unit-length float32 copy of the rows of ``matrix``."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _closest_to_centre(vectors, idx, keep):
+    centre = vectors.mean(axis=0)
+    order = np.argsort(-(vectors @ centre), kind="stable")
+    return idx[order[:keep]], idx[order[keep:]]
+
+
+def _chunk(idx, min_k, max_k):
+    """Cut ``idx`` into consecutive groups of ``min_k..max_k`` rows."""
+    pieces = np.array_split(idx, -(-len(idx) // max_k))
+    groups = [p for p in pieces if len(p) >= min_k]
+    misc = [p for p in pieces if len(p) < min_k]
+    return [], groups, misc
+
+
+def _principal_axis(vectors, seed, iterations=8):
+    centred = vectors - vectors.mean(axis=0)
+    axis = np.random.default_rng(seed).standard_normal(vectors.shape[1])
+    for _ in range(iterations):
+        axis = centred.T @ (centred @ axis)
+        axis /= max(np.linalg.norm(axis), 1e-12)
+    return axis.astype(np.float32)
+
+
+def _cut(idx, margin, min_k):
+    n = len(idx)
+    low = max(min_k, int(n * MIN_SPLIT_FRACTION))
+    order = np.argsort(-margin, kind="stable")
+    cut = int(np.clip(np.count_nonzero(margin > 0), low, n - low))
+    return [idx[order[:cut]], idx[order[cut:]]], [], []
+
+
+def _bisect(embeddings, idx, min_k, max_k, seed):
+    """Split one node; returns ``(children, finished_groups, misc)``."""
+    vectors = embeddings[idx]
+    n = len(idx)
+
+    # Too small to give two valid halves: keep the tightest max_k rows
+    if n < 2 * min_k:
+        group, rest = _closest_to_centre(vectors, idx, max_k)
+        return [], [group], [rest]
+
+    # Identical rows have no split worth searching for
+    if np.ptp(vectors, axis=0).max() < 1e-6:
+        return _chunk(idx, min_k, max_k)
+
+    if n <= SMALL_NODE_FACTOR * max_k:
+        projection = vectors @ _principal_axis(vectors, seed)
+        return _cut(idx, projection - np.median(projection), min_k)
+
+    from sklearn.cluster import MiniBatchKMeans
+
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if n > FIT_SAMPLE_SIZE:
+        sample = vectors[rng.choice(n, FIT_SAMPLE_SIZE, replace=False)]
+    km = MiniBatchKMeans(
+        n_clusters=2,
+        batch_size=min(len(sample), 4096),
+        n_init=3,
+        random_state=int(rng.integers(2**31 - 1)),
+    ).fit(sample)
+    centres = km.cluster_centers_.astype(np.float32)
+    if np.linalg.norm(centres[0] - centres[1]) < 1e-6:
+        return _chunk(idx, min_k, max_k)
+
+    # Signed margin towards centre 0; cutting the sorted margin keeps the
+    # 2-means partition when it is balanced enough and rebalances otherwise
+    offset = (centres[0] @ centres[0] - centres[1] @ centres[1]) / 2
+    margin = vectors @ (centres[0] - centres[1]) - offset
+    return _cut(idx, margin, min_k)
+
+
+def size_constrained_clusters(
+    embeddings, min_k, max_k, n_jobs=None, random_state=42
+):
+    """Partition rows of ``embeddings`` into groups of ``min_k..max_k`` rows.
+
+    Returns ``(groups, misc)`` where ``groups`` is a list of row-position
+    arrays and ``misc`` holds positions that could not be placed.
+    """
+    from threadpoolctl import threadpool_limits
+
+    min_k = max(1, int(min_k))
+    max_k = max(min_k, int(max_k))
+    n_jobs = n_jobs or os.cpu_count() or 1
+    embeddings = normalize_rows(embeddings)
+    n = len(embeddings)
+
+    groups, misc = [], []
+    if n < min_k:
+        return groups, np.arange(n)
+
+    frontier = [np.arange(n)]
+    depth = 0
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        while frontier:
+            to_split = []
+            for idx in frontier:
+                if len(idx) <= max_k:
+                    groups.append(idx)
+                else:
+                    to_split.append(idx)
+            seeds = [
+                random_state + depth * 1_000_003 + i for i in range(len(to_split))
+            ]
+
+            def split(args):
+                idx, seed = args
+                return _bisect(embeddings, idx, min_k, max_k, seed)
+
+            if len(to_split) >= n_jobs:
+                # Many small nodes: one core each instead of nested threading
+                with threadpool_limits(limits=1):
+                    results = list(pool.map(split, zip(to_split, seeds)))
+            else:
+                # Few large nodes: let BLAS/OpenMP use every core per fit
+                results = [split(args) for args in zip(to_split, seeds)]
+
+            frontier = []
+            for children, finished, leftovers in results:
+                frontier.extend(children)
+                groups.extend(finished)
+                misc.extend(leftovers)
+            depth += 1
+
+    misc = np.concatenate(misc) if misc else np.array([], dtype=np.int64)
+    return groups, misc
+
+
+def reassign_to_groups(
+    embeddings, groups, misc, max_k, min_similarity=0.5, block_bytes=64 * 2**20
+):
+    """Move leftover rows into the most similar group that still has room.
+
+    Misc rows are gathered and normalized block by block, so at most
+    ``block_bytes`` of rows and of scores exist at once on top of the
+    caller's ``embeddings``; no normalized copy of the whole matrix is made.
+    Rows whose best match is below ``min_similarity`` stay in ``misc``.
+    Returns ``(groups, misc, moved)``.
+    """
+    if len(misc) == 0 or not groups:
+        return groups, misc, 0
+    centroids = normalize_rows(
+        [normalize_rows(embeddings[g]).mean(axis=0) for g in groups]
+    )
+    capacity = max_k - np.array([len(g) for g in groups])
+    block_size = max(1, block_bytes // (4 * max(len(groups), embeddings.shape[1])))
+
+    added = [[] for _ in groups]
+    remaining = []
+    for start in range(0, len(misc), block_size):
+        rows = np.asarray(misc[start: start + block_size])
+        sims = normalize_rows(embeddings[rows]) @ centroids.T
+        sims[:, capacity <= 0] = -np.inf
+        pending = np.arange(len(rows))
+        while len(pending):
+            best = sims[pending].argmax(axis=1)
+            best_sim = sims[pending, best]
+            keep = best_sim >= min_similarity
+            remaining.extend(rows[pending[~keep]])
+            pending, best, best_sim = pending[keep], best[keep], best_sim[keep]
+
+            # Most similar rows claim capacity first; losers retry elsewhere
+            retry = []
+            for i in np.argsort(-best_sim, kind="stable"):
+                g = best[i]
+                if capacity[g] > 0:
+                    capacity[g] -= 1
+                    added[g].append(rows[pending[i]])
+                else:
+                    retry.append(pending[i])
+            full = capacity <= 0
+            sims[:, full] = -np.inf
+            pending = np.array(retry, dtype=np.int64)
+
+    moved = sum(len(a) for a in added)
+    groups = [
+        np.concatenate([g, np.asarray(a, dtype=g.dtype)]) if a else g
+        for g, a in zip(groups, added)
+    ]
+    return groups, np.asarray(remaining, dtype=np.int64), moved
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+import metrics
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "KEYWORD_EMBEDDING_CACHE_DIR", os.path.join(".cache", "embeddings")
+)
+DEFAULT_MAX_ENTRIES = int(os.environ.get("KEYWORD_EMBEDDING_CACHE_MAX", 2_000_000))
+
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFKC", str(text)).lower().split())
+
+
+def _text_key(text):
+    digest = hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16)
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store for a single model.
+
+    Vectors live in a memory-mapped float32 matrix (``vectors.f32``) and
+    ``index.json`` maps the hash of each normalized text to its row and a
+    last-used tick. The file is mapped, but ``lookup`` gathers hit rows into
+    a new array, so callers own (and may modify) what they get back. When
+    the store grows past ``max_entries`` the least recently used rows are
+    dropped and the matrix is compacted.
+
+    Jobs, the CLI and worker processes can share one store: writes and
+    index reloads hold an exclusive ``flock`` on ``lock``, and another
+    process's writes are picked up when the index file changes.
+    """
+
+    def __init__(
+        self, model_name, cache_dir=DEFAULT_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES
+    ):
+        safe_name = model_name.replace("/", "__")
+        self.model_name = model_name
+        self.path = os.path.join(cache_dir, safe_name)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        with self._file_lock():
+            self._load_index()
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, "lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _index_mtime(self):
+        try:
+            return os.stat(self._index_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def _refresh(self):
+        """Reload the index if another process rewrote it; keeps our ticks."""
+        if self._index_mtime() == self._loaded_mtime:
+            return
+        ticks = {key: entry[1] for key, entry in self.rows.items()}
+        tick = self.tick
+        self._load_index()
+        self.tick = max(self.tick, tick)
+        for key, (row, disk_tick) in self.rows.items():
+            if key in ticks and ticks[key] > disk_tick:
+                self.rows[key] = (row, ticks[key])
+
+    @property
+    def _matrix_file(self):
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _index_file(self):
+        return os.path.join(self.path, "index.json")
+
+    def _load_index(self):
+        self.dim = None
+        self.rows = {}
+        self.tick = 0
+        self.vectors = None
+        self._loaded_mtime = self._index_mtime()
+        if not os.path.exists(self._index_file):
+            return
+        try:
+            with open(self._index_file) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            print("⚠️ Embedding cache index unreadable, starting empty.")
+            return
+        self.dim = meta["dim"]
+        self.rows = {k: tuple(v) for k, v in meta["rows"].items()}
+        self.tick = meta.get("tick", 0)
+        n_rows = meta["n_rows"]
+        expected = n_rows * self.dim * 4
+        size = 0
+        if os.path.exists(self._matrix_file):
+            size = os.path.getsize(self._matrix_file)
+        if size < expected:
+            print("⚠️ Embedding cache matrix truncated, starting empty.")
+            self.dim, self.rows = None, {}
+            return
+        if size > expected:
+            # Rows appended by an interrupted write are not in the index
+            os.truncate(self._matrix_file, expected)
+        self._open_matrix(n_rows)
+
+    def _open_matrix(self, n_rows):
+        if n_rows == 0 or self.dim is None:
+            self.vectors = None
+            return
+        self.vectors = np.memmap(
+            self._matrix_file, dtype=np.float32, mode="r", shape=(n_rows, self.dim)
+        )
+
+    def _save_index(self, n_rows):
+        tmp = self._index_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "model": self.model_name,
+                    "dim": self.dim,
+                    "n_rows": n_rows,
+                    "tick": self.tick,
+                    "rows": self.rows,
+                },
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._index_file)
+        self._loaded_mtime = self._index_mtime()
+
+    def lookup(self, texts):
+        """Return ``(vectors, missing)`` for ``texts``.
+
+        ``vectors`` has a row for every text; rows listed in ``missing``
+        (positions into ``texts``) are zero and still need encoding.
+        """
+        keys = [_text_key(t) for t in texts]
+        with self._lock:
+            if self._index_mtime() != self._loaded_mtime:
+                with self._file_lock():
+                    self._refresh()
+            self.tick += 1
+            found_pos, found_rows, missing = [], [], []
+            for pos, key in enumerate(keys):
+                entry = self.rows.get(key)
+                if entry is None or self.vectors is None:
+                    missing.append(pos)
+                else:
+                    found_pos.append(pos)
+                    found_rows.append(entry[0])
+                    self.rows[key] = (entry[0], self.tick)
+            self.hits += len(found_pos)
+            self.misses += len(missing)
+            if self.dim is None:
+                return None, missing
+            out = np.zeros((len(texts), self.dim), dtype=np.float32)
+            if found_pos:
+                out[found_pos] = self.vectors[found_rows]
+        return out, missing
+
+    def add(self, texts, vectors):
+        """Append ``vectors`` for ``texts`` and evict if over capacity."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        with self._lock, self._file_lock():
+            # Another process may have appended or compacted since we loaded
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            n_rows = 0 if self.vectors is None else self.vectors.shape[0]
+            new_keys = []
+            new_vecs = []
+            for text, vec in zip(texts, vectors):
+                key = _text_key(text)
+                if key in self.rows:
+                    continue
+                self.rows[key] = (n_rows + len(new_keys), self.tick)
+                new_keys.append(key)
+                new_vecs.append(vec)
+            if new_vecs:
+                # Release the read-only map before growing the file
+                self.vectors = None
+                with open(self._matrix_file, "ab") as f:
+                    f.write(np.asarray(new_vecs, dtype=np.float32).tobytes())
+                n_rows += len(new_vecs)
+            if len(self.rows) > self.max_entries:
+                n_rows = self._evict(n_rows)
+            self._save_index(n_rows)
+            self._open_matrix(n_rows)
+
+    def _evict(self, n_rows):
+        keep = sorted(self.rows.items(), key=lambda kv: kv[1][1], reverse=True)
+        keep = keep[: self.max_entries]
+        old = np.memmap(
+            self._matrix_file, dtype=np.float32, mode="r", shape=(n_rows, self.dim)
+        )
+        old_rows = np.array([entry[0] for _, entry in keep], dtype=np.int64)
+        order = np.argsort(old_rows)
+        compacted = np.asarray(old[old_rows[order]])
+        del old
+        tmp = self._matrix_file + ".tmp"
+        compacted.tofile(tmp)
+        os.replace(tmp, self._matrix_file)
+        self.rows = {
+            keep[j][0]: (new_row, keep[j][1][1]) for new_row, j in enumerate(order)
+        }
+        print(f"🧹 Embedding cache evicted {n_rows - len(self.rows)} rows.")
+        return len(self.rows)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": len(self.rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name):
+    with _caches_lock:
+        if model_name not in _caches:
+            _caches[model_name] = EmbeddingCache(model_name)
+        return _caches[model_name]
+
+
+def encode_with_cache(
+    model, texts, model_name, batch_size=256, show_progress_bar=False
+):
+    """Embed ``texts`` with ``model``, only encoding texts not already cached.
+
+    The cache is keyed on the normalized text, but the model always sees
+    the original text of the first keyword with that key.
+    """
+    texts = [str(t) for t in texts]
+    # Alternative backends (see onnx_backend) keep their vectors separate
+    cache = get_embedding_cache(getattr(model, "cache_name", model_name))
+    vectors, missing = cache.lookup(texts)
+
+    if missing:
+        # Encode each distinct normalized miss once, as originally written
+        unique = {}
+        for pos in missing:
+            unique.setdefault(normalize_text(texts[pos]), []).append(pos)
+        new_texts = [texts[positions[0]] for positions in unique.values()]
+        new_vecs = np.asarray(
+            model.encode(
+                new_texts, batch_size=batch_size, show_progress_bar=show_progress_bar
+            ),
+            dtype=np.float32,
+        )
+        if vectors is None:
+            vectors = np.zeros((len(texts), new_vecs.shape[1]), dtype=np.float32)
+        for vec, positions in zip(new_vecs, unique.values()):
+            vectors[positions] = vec
+        cache.add(new_texts, new_vecs)
+
+    if vectors is None:
+        vectors = np.zeros((0, 0), dtype=np.float32)
+    print(f"🗃️ Embedding cache: {len(texts) - len(missing)}/{len(texts)} hits")
+    metrics.record("embedding_cache_hits", len(texts) - len(missing))
+    metrics.record("embedding_cache_misses", len(missing))
+    return vectors
+
+
+def embedding_cache_stats():
+    return [cache.stats() for cache in _caches.values()]
@@ -0,0 +1,125 @@
+"""Minimal local stand-in for the OpenAI chat completions endpoint.
+
+Run ``python fake_openai.py --port 8765`` and start the app or CLI with
+``OPENAI_API_BASE=http://127.0.0.1:8765/v1`` to exercise labeling without
+network access. Latency and error rates are configurable so retries and
+rate limiting can be observed.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _fake_reply(prompt):
+    if "### Cluster " in prompt:
+        return _fake_batch_reply(prompt)
+    keywords = [
+        line[2:].strip() for line in prompt.splitlines() if line.startswith("- ")
+    ]
+    topic = keywords[0] if keywords else "general topic"
+    return (
+        f"Intent Description: Users are looking for information about {topic}.\n"
+        "Intent Type: Exploration"
+    )
+
+
+def _fake_batch_reply(prompt):
+    answers = []
+    for block in prompt.split("### Cluster ")[1:]:
+        lines = block.splitlines()
+        keywords = [line[2:].strip() for line in lines[1:] if line.startswith("- ")]
+        topic = keywords[0] if keywords else "general topic"
+        answers.append(
+            {
+                "cluster_id": lines[0].strip(),
+                "intent_description": f"Users are looking for information about {topic}.",
+                "intent_type": "Exploration",
+            }
+        )
+    return json.dumps(answers)
+
+
+def make_handler(latency=0.0, error_rate=0.0, reply_fn=_fake_reply):
+    class FakeOpenAIHandler(BaseHTTPRequestHandler):
+        requests_served = 0
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            FakeOpenAIHandler.requests_served += 1
+            if latency:
+                time.sleep(latency)
+            if random.random() < error_rate:
+                status = random.choice([429, 500, 503])
+                self._send(
+                    status,
+                    {"error": {"message": "fake failure", "type": "server_error"}},
+                )
+                return
+
+            messages = request.get("messages", [])
+            prompt = "\n".join(m.get("content", "") for m in messages)
+            content = reply_fn(prompt)
+            prompt_tokens = len(prompt) // 4 + 1
+            completion_tokens = len(content) // 4 + 1
+            self._send(
+                200,
+                {
+                    "id": f"chatcmpl-fake-{FakeOpenAIHandler.requests_served}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "fake"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                },
+            )
+
+    return FakeOpenAIHandler
+
+
+def start_fake_server(port=0, latency=0.0, error_rate=0.0, reply_fn=_fake_reply):
+    """Start the server on a daemon thread and return ``(server, base_url)``."""
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", port), make_handler(latency, error_rate, reply_fn)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per call")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", args.port), make_handler(args.latency, args.error_rate)
+    )
+    print(f"🧪 Fake OpenAI listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
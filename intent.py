@@ -1,28 +1,196 @@
 import os
+import json
 import pandas as pd
 from dotenv import load_dotenv
 import openai
+import random
+import threading
 import time
 import datetime
-import streamlit as st
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from label_cache import cluster_key, get_label_cache
+from centroid_index import get_centroid_index, DEFAULT_THRESHOLD
+from models import EMBEDDING_MODEL_NAME
 
-# Access OpenAI API key from Streamlit secrets
-openai.api_key = st.secrets["OPENAI_API_KEY"]["value"]
+from progress import StreamlitProgress
+import metrics
+from metrics import instrument
 
-if openai.api_key is None:
-    raise ValueError("API key not found. Please set your OPENAI_API_KEY.")
+OPENAI_MODEL = "gpt-4o-2024-08-06"
+# Bump whenever the instructions change so cached labels are not reused
+PROMPT_VERSION = "2025-06-v1"
+LABEL_CONCURRENCY = int(os.environ.get("LABEL_CONCURRENCY", 8))
+REQUESTS_PER_MINUTE = int(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", 500))
+TOKENS_PER_MINUTE = int(os.environ.get("OPENAI_TOKENS_PER_MINUTE", 200_000))
+LABEL_BATCH_SIZE = int(os.environ.get("LABEL_BATCH_SIZE", 20))
+BATCH_TOKEN_BUDGET = int(os.environ.get("LABEL_BATCH_TOKEN_BUDGET", 3000))
+MAX_RETRIES = 5
+# Completion tokens per cluster in batch replies; grows with observed replies
+BATCH_LABEL_TOKENS = 60
+BATCH_MAX_TOKENS = 4096
 
+SYSTEM_MESSAGE = "You are an assistant that helps with user intent classification."
+INTENT_INSTRUCTIONS = (
+    "You are a world-class expert in search behavior and user intent classification.\n"
+    "You will receive a list of search keywords that belong to the same topic cluster.\n\n"
+    "Your task is to analyze this cluster deeply and return:\n"
+    "1. A concise, clear sentence that explains what users in this cluster are trying to achieve or learn.\n"
+    "2. A single, meaningful **intent category** for the cluster (not just generic terms like 'Informational', but actual purpose or action, like 'Booking', 'Comparison', 'Diagnosis', 'Purchase', 'Complaint', 'Exploration', etc.).\n\n"
+    "Think about what real users are hoping to accomplish based on these terms.\n"
+    "Make sure your category is specific, even if it's not a traditional taxonomy label.\n\n"
+)
+BATCH_INSTRUCTIONS = (
+    "You are a world-class expert in search behavior and user intent classification.\n"
+    "You will receive several clusters of search keywords; each cluster shares one topic.\n\n"
+    "For every cluster return:\n"
+    "1. A concise, clear sentence that explains what users in this cluster are trying to achieve or learn.\n"
+    "2. A single, meaningful **intent category** for the cluster (not just generic terms like 'Informational', but actual purpose or action, like 'Booking', 'Comparison', 'Diagnosis', 'Purchase', 'Complaint', 'Exploration', etc.).\n\n"
+    "Respond with only a JSON array containing one object per cluster, in the form:\n"
+    '[{"cluster_id": "<id>", "intent_description": "<detailed sentence>", '
+    '"intent_type": "<one-word category>"}]\n\n'
+    "Here are the clusters:\n"
+)
 
-def label_cluster_with_openai_intent(phrases):
+
+class UsageTracker:
+    """Thread-safe tally of requests, tokens, latencies and retries."""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def add(self, response, latency=None):
+        usage = response.get("usage") or {}
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+
+def configure_openai():
+    """Resolve the API key from the environment (or .env), then Streamlit secrets.
+
+    The key and ``OPENAI_API_BASE`` are applied independently, so a base URL
+    set after the key was configured still takes effect.
+    """
+    load_dotenv()
+    # Point at a local fake server (see fake_openai.py) for offline testing
+    if os.environ.get("OPENAI_API_BASE"):
+        openai.api_base = os.environ["OPENAI_API_BASE"]
+
+    if openai.api_key:
+        return
+    openai.api_key = os.environ.get("OPENAI_API_KEY")
+    if not openai.api_key:
+        try:
+            import streamlit as st
+
+            openai.api_key = st.secrets["OPENAI_API_KEY"]["value"]
+        except Exception:
+            openai.api_key = None
+
+    if openai.api_key is None:
+        raise ValueError("API key not found. Please set your OPENAI_API_KEY.")
+
+
+class RateLimiter:
+    """Sliding one-minute window over request count and token usage."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._events = deque()
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._events and now - self._events[0][0] >= 60:
+                    self._tokens -= self._events.popleft()[1]
+                if (
+                    len(self._events) < self.requests_per_minute
+                    and self._tokens + tokens <= self.tokens_per_minute
+                ):
+                    self._events.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                wait = 60 - (now - self._events[0][0])
+            time.sleep(max(wait, 0.05))
+
+
+def estimate_tokens(text):
+    # Rough heuristic (~4 characters per token) good enough for rate limiting
+    return len(text) // 4 + 1
+
+
+def _is_retryable(error):
+    if isinstance(
+        error,
+        (
+            openai.error.RateLimitError,
+            openai.error.ServiceUnavailableError,
+            openai.error.APIConnectionError,
+            openai.error.Timeout,
+        ),
+    ):
+        return True
+    status = getattr(error, "http_status", None)
+    return isinstance(error, openai.error.APIError) and (
+        status is None or status >= 500
+    )
+
+
+def chat_completion(
+    messages, max_tokens, limiter=None, usage=None, max_retries=MAX_RETRIES
+):
+    """Call the chat API, retrying 429 and 5xx errors with exponential backoff."""
+    prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire(prompt_tokens + max_tokens)
+        try:
+            start = time.monotonic()
+            response = openai.ChatCompletion.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0,
+            )
+            if usage is not None:
+                usage.add(response, time.monotonic() - start)
+            return response
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            if usage is not None:
+                usage.add_retry()
+            delay = min(60, 2**attempt) + random.uniform(0, 1)
+            print(f"🔁 OpenAI error ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def label_cluster_with_openai_intent(phrases, limiter=None, usage=None):
     prompt = (
-        "You are a world-class expert in search behavior and user intent classification.\n"
-        "You will receive a list of search keywords that belong to the same topic cluster.\n\n"
-        "Your task is to analyze this cluster deeply and return:\n"
-        "1. A concise, clear sentence that explains what users in this cluster are trying to achieve or learn.\n"
-        "2. A single, meaningful **intent category** for the cluster (not just generic terms like 'Informational', but actual purpose or action, like 'Booking', 'Comparison', 'Diagnosis', 'Purchase', 'Complaint', 'Exploration', etc.).\n\n"
-        "Think about what real users are hoping to accomplish based on these terms.\n"
-        "Make sure your category is specific, even if it's not a traditional taxonomy label.\n\n"
-        "Respond in exactly this format:\n"
+        INTENT_INSTRUCTIONS
+        + "Respond in exactly this format:\n"
         "Intent Description: <detailed sentence>\n"
         "Intent Type: <one-word category>\n\n"
         "Here are the keywords:\n"
@@ -32,17 +200,14 @@ def label_cluster_with_openai_intent(phrases):
 
     try:
         print(f"🔍 Prompting OpenAI with {len(phrases)} keywords...")
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-2024-08-06",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an assistant that helps with user intent classification.",
-                },
+        response = chat_completion(
+            [
+                {"role": "system", "content": SYSTEM_MESSAGE},
                 {"role": "user", "content": prompt},
             ],
             max_tokens=150,
-            temperature=0,
+            limiter=limiter,
+            usage=usage,
         )
         result = response["choices"][0]["message"]["content"].strip()
         print("📥 OpenAI response:\n", result)
@@ -67,36 +232,308 @@ def label_cluster_with_openai_intent(phrases):
         return "Generic intent description", "Generic"
 
 
-def label_all_clusters(df, embeddings, centers):
+def _cluster_block(cluster_id, phrases):
+    keywords = "\n".join(f"- {kw}" for kw in phrases)
+    return f"### Cluster {cluster_id}\n{keywords}\n"
+
+
+def _parse_batch_response(text, expected_ids):
+    # Tolerate code fences or prose around the array
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        items = json.loads(text[start: end + 1])
+    except ValueError:
+        return {}
+    parsed = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        cluster_id = str(item.get("cluster_id", "")).strip()
+        desc = str(item.get("intent_description") or "").strip()
+        intent_type = str(item.get("intent_type") or "").strip()
+        if cluster_id in expected_ids and desc and intent_type:
+            parsed[cluster_id] = (desc, intent_type)
+    return parsed
+
+
+_label_tokens = {"per_cluster": BATCH_LABEL_TOKENS}
+_label_tokens_lock = threading.Lock()
+
+
+def label_clusters_batch_with_openai(batch, limiter=None, usage=None):
+    """Label several clusters in one request.
+
+    ``batch`` maps cluster id to its sample keywords. Returns a dict with an
+    entry for every cluster the model answered well-formed; missing ids are
+    the caller's to retry.
+    """
+    keys = {str(cluster_id): cluster_id for cluster_id in batch}
+    prompt = BATCH_INSTRUCTIONS + "\n".join(
+        _cluster_block(key, batch[cluster_id]) for key, cluster_id in keys.items()
+    )
+    print(f"🔍 Prompting OpenAI with a batch of {len(batch)} clusters...")
+    messages = [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt},
+    ]
+    # 50% margin over the longest per-cluster reply seen so far
+    max_tokens = min(
+        BATCH_MAX_TOKENS, int(_label_tokens["per_cluster"] * 1.5) * len(batch) + 50
+    )
+    while True:
+        response = chat_completion(
+            messages, max_tokens=max_tokens, limiter=limiter, usage=usage
+        )
+        choice = response["choices"][0]
+        if choice.get("finish_reason") != "length" or max_tokens >= BATCH_MAX_TOKENS:
+            break
+        # A truncated JSON array would fail the whole batch; ask again with room
+        max_tokens = min(BATCH_MAX_TOKENS, max_tokens * 2)
+        print(f"✂️ Batch reply truncated, retrying with max_tokens={max_tokens}")
+    result = choice["message"]["content"]
+    parsed = _parse_batch_response(result, set(keys))
+    completion = (response.get("usage") or {}).get("completion_tokens")
+    if parsed and completion:
+        with _label_tokens_lock:
+            _label_tokens["per_cluster"] = max(
+                _label_tokens["per_cluster"], completion / len(parsed)
+            )
+    return {keys[key]: labels for key, labels in parsed.items()}
+
+
+def pack_batches(
+    samples, max_clusters=LABEL_BATCH_SIZE, token_budget=BATCH_TOKEN_BUDGET
+):
+    """Group clusters into batches bounded by cluster count and prompt tokens."""
+    batches, current, current_tokens = [], {}, estimate_tokens(BATCH_INSTRUCTIONS)
+    for cluster_id, phrases in samples.items():
+        tokens = estimate_tokens(_cluster_block(cluster_id, phrases)) + 60
+        if current and (
+            len(current) >= max_clusters or current_tokens + tokens > token_budget
+        ):
+            batches.append(current)
+            current, current_tokens = {}, estimate_tokens(BATCH_INSTRUCTIONS)
+        current[cluster_id] = phrases
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _label_batch_safely(batch, limiter, usage):
+    """Label a batch, re-asking only the clusters that came back malformed."""
+    results = {}
+    if len(batch) > 1:
+        try:
+            results.update(label_clusters_batch_with_openai(batch, limiter, usage))
+        except Exception as e:
+            print("❌ OpenAI batch error:", e)
+
+    failed = {cid: phrases for cid, phrases in batch.items() if cid not in results}
+    if failed and len(failed) > 1 and len(failed) < len(batch):
+        try:
+            results.update(label_clusters_batch_with_openai(failed, limiter, usage))
+        except Exception as e:
+            print("❌ OpenAI batch error:", e)
+        failed = {cid: p for cid, p in failed.items() if cid not in results}
+
+    # Whatever is still missing falls back to one request per cluster
+    for cluster_id, phrases in failed.items():
+        try:
+            results[cluster_id] = label_cluster_with_openai_intent(
+                phrases, limiter, usage
+            )
+        except Exception:
+            results[cluster_id] = ("N/A", "N/A")
+    return results
+
+
+@instrument("labeling")
+def label_all_clusters(
+    df,
+    embeddings,
+    centers,
+    concurrency=LABEL_CONCURRENCY,
+    requests_per_minute=REQUESTS_PER_MINUTE,
+    tokens_per_minute=TOKENS_PER_MINUTE,
+    batch_size=LABEL_BATCH_SIZE,
+    force_refresh=False,
+    reuse_threshold=DEFAULT_THRESHOLD,
+    progress=None,
+    skip_reuse=(),
+):
+    """Label every cluster of ``df`` with an intent description and type.
+
+    ``skip_reuse`` lists cluster ids that must not inherit the label of a
+    similar past cluster, e.g. grown clusters that need a fresh label.
+    """
     cluster_labels = {}
     cluster_intents = {}
-    total_clusters = df["Cluster"].nunique()
+    cluster_ids = df["Cluster"].unique()
+    total_clusters = len(cluster_ids)
+    samples = df.groupby("Cluster", sort=False)["Keyword"].apply(
+        lambda s: s.tolist()[:10]
+    )
+
+    # Reuse labels for clusters whose sample keywords were labeled before
+    label_cache = get_label_cache()
+    keys = {
+        cluster_num: cluster_key(OPENAI_MODEL, PROMPT_VERSION, samples[cluster_num])
+        for cluster_num in cluster_ids
+    }
+    cached = {} if force_refresh else label_cache.get_many(keys.values())
+    for cluster_num, key in keys.items():
+        if key in cached:
+            cluster_labels[cluster_num], cluster_intents[cluster_num] = cached[key]
+    cache_hits = len(cluster_labels)
+    cache_misses = total_clusters - cache_hits
+
+    # Clusters close to one labeled in an earlier run inherit its label
+    centroid_index = get_centroid_index(
+        f"{EMBEDDING_MODEL_NAME}-{OPENAI_MODEL}-{PROMPT_VERSION}"
+    )
+    has_centers = centers is not None and len(centers) > 0
+    semantic_hits = 0
+    if has_centers and not force_refresh:
+        skip = set(skip_reuse)
+        pending = [
+            c
+            for c in cluster_ids
+            if c not in cluster_labels and c not in skip and int(c) < len(centers)
+        ]
+        matches = centroid_index.query(
+            centers[[int(c) for c in pending]], threshold=reuse_threshold
+        )
+        for cluster_num, match in zip(pending, matches):
+            if match is not None:
+                cluster_labels[cluster_num], cluster_intents[cluster_num] = match
+                semantic_hits += 1
+
+    batches = pack_batches(
+        {
+            cluster_num: samples[cluster_num]
+            for cluster_num in cluster_ids
+            if cluster_num not in cluster_labels
+        },
+        max_clusters=max(1, batch_size),
+    )
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    usage = UsageTracker()
+    if batches:
+        configure_openai()
     start_time = time.time()
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    if progress is None:
+        progress = StreamlitProgress()
 
-    for i, cluster_num in enumerate(df["Cluster"].unique(), start=1):
-        cluster_keywords = df[df["Cluster"] == cluster_num]["Keyword"].tolist()
-        sample_keywords = cluster_keywords[:10]
-        try:
-            description, intent_type = label_cluster_with_openai_intent(sample_keywords)
-        except Exception:
-            description, intent_type = "N/A", "N/A"
+    # Requests run on worker threads; progress is only reported from here
+    done = 0
+    new_labels = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [
+            pool.submit(_label_batch_safely, batch, limiter, usage)
+            for batch in batches
+        ]
+        for future in as_completed(futures):
+            results = future.result()
+            for cluster_num, (description, intent_type) in results.items():
+                cluster_labels[cluster_num] = description
+                cluster_intents[cluster_num] = intent_type
+            # Fallback labels are not worth keeping; they get retried next run
+            fresh = {
+                cluster_num: labels
+                for cluster_num, labels in results.items()
+                if labels[1] not in ("Generic", "N/A")
+            }
+            label_cache.put_many({keys[c]: labels for c, labels in fresh.items()})
+            new_labels.update(fresh)
+            done = len(cluster_labels)
 
-        cluster_labels[cluster_num] = description
-        cluster_intents[cluster_num] = intent_type
+            elapsed = time.time() - start_time
+            avg_time = elapsed / done
+            eta = avg_time * (total_clusters - done)
+            eta_fmt = str(datetime.timedelta(seconds=int(eta)))
 
-        elapsed = time.time() - start_time
-        avg_time = elapsed / i
-        eta = avg_time * (total_clusters - i)
-        eta_fmt = str(datetime.timedelta(seconds=int(eta)))
+            progress.update(
+                done / total_clusters,
+                f"✅ Cluster `{done}/{total_clusters}` processed &nbsp;|&nbsp; ⏱️ Elapsed: `{elapsed:.1f}s` &nbsp;|&nbsp; ⏳ ETA: `{eta_fmt}` &nbsp;|&nbsp; 🧾 Tokens: `{usage.total_tokens}` &nbsp;|&nbsp; 🗂️ Cache: `{cache_hits}` hits / `{cache_misses}` misses"
+            )
 
-        progress_bar.progress(i / total_clusters)
-        status_text.markdown(
-            f"✅ Cluster `{i}/{total_clusters}` processed &nbsp;|&nbsp; ⏱️ Elapsed: `{elapsed:.1f}s` &nbsp;|&nbsp; ⏳ ETA: `{eta_fmt}`"
+    if has_centers:
+        indexed = [c for c in new_labels if int(c) < len(centers)]
+        centroid_index.add(
+            centers[[int(c) for c in indexed]], [new_labels[c] for c in indexed]
         )
 
     df["Intent_Description"] = df["Cluster"].map(cluster_labels)
     df["Intent_Type"] = df["Cluster"].map(cluster_intents)
-    status_text.success("🎉 All clusters labeled!")
+    # Request threads have no run context, so usage is reported from here
+    metrics.record("openai_requests", usage.requests)
+    metrics.record("openai_retries", usage.retries)
+    metrics.record("openai_prompt_tokens", usage.prompt_tokens)
+    metrics.record("openai_completion_tokens", usage.completion_tokens)
+    metrics.observe("openai_latency_seconds", usage.latencies)
+    metrics.record("label_cache_hits", cache_hits)
+    metrics.record("label_cache_misses", cache_misses)
+    metrics.record("label_semantic_hits", semantic_hits)
+    print(
+        f"🧾 OpenAI usage: {usage.requests} requests, {usage.prompt_tokens} prompt "
+        f"+ {usage.completion_tokens} completion tokens"
+    )
+    print(
+        f"♻️ LLM calls avoided: {cache_hits} exact cache hits, "
+        f"{semantic_hits} reused from similar clusters"
+    )
+    progress.finish(
+        f"🎉 All clusters labeled! ({usage.requests} requests, "
+        f"{usage.total_tokens} tokens, {cache_hits} cache hits / "
+        f"{cache_misses} misses, {semantic_hits} reused from similar clusters)"
+    )
     return df
+
+
+def label_changed_clusters(df, embeddings, centers, relabel, progress=None, **kwargs):
+    """Label only the clusters in ``relabel``; the rest keep their labels.
+
+    Used for incremental runs, where ``df`` mixes labeled rows of a previous
+    run with new rows that joined existing clusters or formed new ones.
+    """
+    label_columns = ["Intent_Description", "Intent_Type"]
+    for column in label_columns:
+        if column not in df.columns:
+            df[column] = None
+    changed = df["Cluster"].isin(relabel)
+    unchanged = df[~changed].copy()
+
+    # Rows that joined an unchanged cluster take that cluster's labels
+    known = unchanged.dropna(subset=["Intent_Type"]).drop_duplicates("Cluster")
+    for column in label_columns:
+        unchanged[column] = unchanged["Cluster"].map(
+            known.set_index("Cluster")[column]
+        )
+
+    # Interleave new and old members of a changed cluster so its sample, and
+    # so its label-cache key, reflects the grown membership rather than the
+    # first ten keywords it was labeled with before
+    labeled = df[changed]
+    is_new = labeled["Intent_Type"].isna()
+    # A grown cluster stays close to its own stored centroid, so it must
+    # not inherit its old label through semantic reuse either
+    grown = labeled.loc[~is_new, "Cluster"].unique().tolist()
+    order = pd.DataFrame(
+        {
+            "cluster": labeled["Cluster"],
+            "rank": labeled.groupby([labeled["Cluster"], is_new]).cumcount(),
+            "old": ~is_new,
+        }
+    ).sort_values(["cluster", "rank", "old"])
+    labeled = labeled.loc[order.index].drop(columns=label_columns)
+    if not labeled.empty:
+        labeled = label_all_clusters(
+            labeled, embeddings, centers, progress=progress, skip_reuse=grown, **kwargs
+        )
+    print(f"🔁 Relabeled {len(relabel)} of {df['Cluster'].nunique()} clusters")
+    merged = pd.concat([unchanged, labeled], ignore_index=True)
+    order = merged["Cluster"].to_numpy().argsort(kind="stable")
+    return merged.iloc[order].reset_index(drop=True)
@@ -0,0 +1,307 @@
+"""Background pipeline jobs with on-disk checkpoints.
+
+A job runs ``pipeline.run_pipeline`` on a worker thread, so the Streamlit
+script (and every other user's session) keeps responding while it works.
+Each stage's output is pickled to ``<JOBS_DIR>/<job_id>/<stage>.pkl`` as
+soon as it finishes. A resubmitted job, whether after a failure, a browser
+refresh or a server restart, loads the finished stages from disk and
+continues from the first missing one.
+
+Labels are also written to the label cache one batch at a time (see
+``intent.label_all_clusters``), so a job that dies inside labeling
+only re-requests the clusters that were not labeled yet.
+"""
+
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from stage_cache import fingerprint
+
+JOBS_DIR = os.environ.get("KEYWORD_JOBS_DIR", os.path.join(".cache", "jobs"))
+JOB_CONCURRENCY = int(os.environ.get("KEYWORD_JOB_CONCURRENCY", 4))
+JOB_TTL_DAYS = float(os.environ.get("KEYWORD_JOB_TTL_DAYS", 7))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_CONCURRENCY, thread_name_prefix="job")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _atomic_write(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class CheckpointStore:
+    """Disk-backed ``run_stage`` hook for ``run_pipeline``.
+
+    ``inner`` is another ``run_stage`` hook (e.g. ``StageCache.run``) used
+    for stages that have no checkpoint yet. ``on_stage`` is told
+    "checkpoint", "running", then "cached" or "done" for every stage.
+    """
+
+    def __init__(self, job_dir, inner=None, on_stage=None):
+        self.job_dir = job_dir
+        self.inner = inner
+        self.on_stage = on_stage
+        os.makedirs(job_dir, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.job_dir, f"{name}.pkl")
+
+    def has(self, name):
+        return os.path.exists(self._path(name))
+
+    def load(self, name):
+        with open(self._path(name), "rb") as f:
+            return pickle.load(f)
+
+    def save(self, name, value):
+        _atomic_write(self._path(name), pickle.dumps(value, protocol=4))
+
+    def run(self, name, fn, *args, **kwargs):
+        if self.has(name):
+            try:
+                result = self.load(name)
+                if self.on_stage:
+                    self.on_stage(name, "checkpoint")
+                metrics.record("checkpoint_hits")
+                return result
+            except Exception as e:
+                # A torn or stale checkpoint is recomputed, never fatal
+                print(f"⚠️ Ignoring unreadable checkpoint {name}: {e}")
+        if self.on_stage:
+            self.on_stage(name, "running")
+        state = "done"
+        if self.inner is not None:
+            result = self.inner(name, fn, *args, **kwargs)
+            # StageCache records whether the stage was served from memory
+            last_run = getattr(getattr(self.inner, "__self__", None), "last_run", {})
+            if last_run.get(name) == "hit":
+                state = "cached"
+        else:
+            result = fn(*args, **kwargs)
+        self.save(name, result)
+        if self.on_stage:
+            self.on_stage(name, state)
+        return result
+
+
+class JobProgress:
+    """Progress sink that records updates in the job status for polling."""
+
+    def __init__(self, job):
+        self.job = job
+
+    def update(self, fraction, message):
+        self.job.update(fraction=min(max(fraction, 0.0), 1.0), message=message)
+
+    def finish(self, message):
+        self.job.update(fraction=1.0, message=message)
+
+
+class Job:
+    def __init__(self, job_id, owner):
+        self.job_id = job_id
+        self.owner = owner
+        self.job_dir = os.path.join(JOBS_DIR, job_id)
+        self.future = None
+        self._lock = threading.Lock()
+        self.status = {
+            "job_id": job_id,
+            "owner": owner,
+            "state": "queued",
+            "stage": None,
+            "stages": {},
+            "fraction": 0.0,
+            "message": "",
+            "error": None,
+            "submitted": time.time(),
+            "finished": None,
+        }
+
+    def update(self, **fields):
+        with self._lock:
+            self.status.update(fields)
+            snapshot = dict(self.status, stages=dict(self.status["stages"]))
+        os.makedirs(self.job_dir, exist_ok=True)
+        _atomic_write(
+            os.path.join(self.job_dir, "status.json"),
+            json.dumps(snapshot, ensure_ascii=False).encode("utf-8"),
+        )
+
+    def on_stage(self, name, state):
+        with self._lock:
+            self.status["stages"][name] = state
+        self.update(stage=name, fraction=0.0, message=f"{name}: {state}")
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.status, stages=dict(self.status["stages"]))
+
+
+def job_id_for(owner, df, *params, **opts):
+    """Deterministic id, so resubmitting the same inputs resumes the same job."""
+    return fingerprint(owner, df, params, opts)
+
+
+def _read_status(job_id):
+    path = os.path.join(JOBS_DIR, os.path.basename(job_id), "status.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _forget(job):
+    # Finished jobs live on disk only: status.json and results.pkl are read
+    # back on demand, so the process does not keep every run's frames
+    with _jobs_lock:
+        if _jobs.get(job.job_id) is job:
+            del _jobs[job.job_id]
+
+
+def _run_job(job, df, args, kwargs, inner):
+    from pipeline import run_pipeline, run_incremental
+
+    store = CheckpointStore(job.job_dir, inner=inner, on_stage=job.on_stage)
+    job.update(state="running", error=None, finished=None)
+    run = metrics.RunMetrics(f"{job.job_id[:16]}-{int(time.time())}")
+    try:
+        with metrics.activate(run):
+            if not store.has("results"):
+                previous = kwargs.pop("previous", None)
+                if previous is not None:
+                    run_fn, args = run_incremental, (previous,) + args
+                else:
+                    run_fn = run_pipeline
+                results = run_fn(
+                    df, *args, progress=JobProgress(job), run_stage=store.run, **kwargs
+                )
+                store.save("results", results)
+    except Exception as e:
+        job.update(
+            state="failed", error=str(e), finished=time.time(), profile=run.summary()
+        )
+        print(f"❌ Job {job.job_id[:8]} failed: {e}")
+        raise
+    job.update(
+        state="done",
+        fraction=1.0,
+        message="done",
+        finished=time.time(),
+        profile=run.summary(),
+    )
+
+
+def prune_jobs(ttl_days=JOB_TTL_DAYS):
+    """Delete checkpoint directories of jobs older than ``ttl_days``."""
+    if not os.path.isdir(JOBS_DIR):
+        return
+    cutoff = time.time() - ttl_days * 86400
+    for name in os.listdir(JOBS_DIR):
+        path = os.path.join(JOBS_DIR, name)
+        with _jobs_lock:
+            active = name in _jobs and not _jobs[name].future.done()
+        if not active and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+            with _jobs_lock:
+                _jobs.pop(name, None)
+
+
+def submit_job(
+    owner,
+    df,
+    words_to_filter,
+    min_k,
+    max_k,
+    positive_intent,
+    negative_intent,
+    fold_plurals=False,
+    run_stage=None,
+    previous=None,
+    refresh_labels=False,
+):
+    """Queue a pipeline run and return its job id.
+
+    A job with the same inputs that is queued or running is reused; one
+    that failed or was lost with the server restarts from its checkpoints,
+    and one that finished loads its saved results.
+    With ``previous`` (an earlier run's results) the new keywords are added
+    to that grouping via ``pipeline.run_incremental``. ``refresh_labels``
+    ignores cached intent labels and asks the LLM again.
+    """
+    job_id = job_id_for(
+        owner,
+        df,
+        words_to_filter,
+        min_k,
+        max_k,
+        positive_intent,
+        negative_intent,
+        fold_plurals=fold_plurals,
+        previous=previous,
+        refresh_labels=refresh_labels,
+    )
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None and not (job.future.done() and job.future.exception()):
+            return job_id
+        finished = _read_status(job_id) if job is None else None
+        results = os.path.join(JOBS_DIR, job_id, "results.pkl")
+        if finished and finished["state"] == "done" and os.path.exists(results):
+            if not refresh_labels:
+                return job_id
+            # Refreshing a finished job again asks the LLM again
+            for stage in ("labeling", "sentiment", "results"):
+                path = os.path.join(JOBS_DIR, job_id, f"{stage}.pkl")
+                if os.path.exists(path):
+                    os.remove(path)
+        job = Job(job_id, owner)
+        job.update(state="queued")
+        args = (words_to_filter, min_k, max_k, positive_intent, negative_intent)
+        kwargs = {
+            "fold_plurals": fold_plurals,
+            "previous": previous,
+            "refresh_labels": refresh_labels,
+        }
+        job.future = _executor.submit(_run_job, job, df, args, kwargs, run_stage)
+        _jobs[job_id] = job
+    job.future.add_done_callback(lambda _: _forget(job))
+    prune_jobs()
+    return job_id
+
+
+def job_status(job_id, owner):
+    """Status dict of a job, read from disk once it is no longer running here."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        status = job.snapshot()
+    else:
+        status = _read_status(job_id)
+        if status is None:
+            return None
+        if status["state"] in ("queued", "running"):
+            # The process that ran it is gone; resubmitting will resume it
+            status["state"] = "interrupted"
+    if status.get("owner") != owner:
+        return None
+    return status
+
+
+def job_result(job_id, owner):
+    """Results dict of a finished job, or ``None``."""
+    status = job_status(job_id, owner)
+    if status is None or status["state"] != "done":
+        return None
+    # Read back from disk so finished results are not held in memory twice
+    store = CheckpointStore(os.path.join(JOBS_DIR, os.path.basename(job_id)))
+    return store.load("results") if store.has("results") else None
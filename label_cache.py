@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "KEYWORD_LABEL_CACHE", os.path.join(".cache", "intent_labels.sqlite3")
+)
+DEFAULT_TTL_DAYS = float(os.environ.get("KEYWORD_LABEL_CACHE_TTL_DAYS", 90))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("KEYWORD_LABEL_CACHE_MAX", 500_000))
+
+
+def cluster_key(model_name, prompt_version, sample_keywords):
+    payload = json.dumps(
+        [model_name, prompt_version, sorted(str(kw) for kw in sample_keywords)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LabelCache:
+    """SQLite-backed store of intent labels keyed by cluster content.
+
+    Entries older than ``ttl_days`` are treated as misses and the least
+    recently used rows are pruned once the table exceeds ``max_entries``.
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_CACHE_PATH,
+        ttl_days=DEFAULT_TTL_DAYS,
+        max_entries=DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            " key TEXT PRIMARY KEY,"
+            " description TEXT NOT NULL,"
+            " intent_type TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS labels_last_used ON labels (last_used)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """Return ``{key: (description, intent_type)}`` for fresh entries."""
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start: start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    "SELECT key, description, intent_type FROM labels "
+                    f"WHERE key IN ({placeholders}) AND created_at >= ?",
+                    (*chunk, now - self.ttl_seconds),
+                ).fetchall()
+                found.update({key: (desc, intent) for key, desc, intent in rows})
+            self._conn.executemany(
+                "UPDATE labels SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Store ``{key: (description, intent_type)}`` and prune old rows."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?, ?)",
+                [(key, d, intent, now, now) for key, (d, intent) in items.items()],
+            )
+            self._conn.execute(
+                "DELETE FROM labels WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self._conn.execute(
+                "DELETE FROM labels WHERE key IN ("
+                " SELECT key FROM labels ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_label_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LabelCache()
+        return _cache
@@ -1,5 +1,6 @@
 import sys
 import os
+import time
 import warnings
 
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
@@ -14,19 +15,20 @@ if "torch" in sys.modules:
 import streamlit as st
 import pandas as pd
 
-from processor import (
-    load_and_clean_file,
-    filter_questions,
-    filter_patterns,
-    cluster_keywords,
-)
-from utils import plot_intent_distribution, export_data_to_excel
-from intent import label_all_clusters
-from sentiment_helper import assign_cluster_sentiment
+# Only light modules are imported up front; torch, transformers, sklearn,
+# matplotlib and openai load on first use (see check_import_budget.py)
+from processor import load_and_clean_file
+from stage_cache import StageCache
+from jobs import submit_job, job_status, job_result
+from reports import request_report, get_report, open_report, REPORT_DOWNLOADS
 from users import login, logout
+from models import warm_up_models, get_model_stats
+from embedding_cache import embedding_cache_stats
 
 st.set_page_config(page_title="🔍 Keyword Intent Grouper", layout="wide")
 
+JOB_POLL_SECONDS = 1.0
+
 if "authenticated" not in st.session_state:
     st.session_state["authenticated"] = False
     st.session_state["username"] = ""
@@ -36,6 +38,20 @@ if not st.session_state["authenticated"]:
     st.stop()
 else:
     logout()
+    # Prefetch model weights in the background; shared by all sessions
+    warm_up_models(background=True)
+    model_stats = get_model_stats()
+    if model_stats:
+        st.sidebar.markdown("### 📦 Loaded Models")
+        for name, stats in model_stats.items():
+            st.sidebar.caption(
+                f"`{name}`: {stats['load_seconds']}s, +{stats['rss_delta_mb']} MB"
+            )
+    for cache_stats in embedding_cache_stats():
+        st.sidebar.caption(
+            f"🗃️ Embedding cache: {cache_stats['entries']} entries, "
+            f"hit rate {cache_stats['hit_rate']:.0%}"
+        )
 
 st.markdown(
     "<h1 style='text-align: center;'>💡 Keyword Intent Grouping App</h1>",
@@ -46,12 +62,20 @@ st.markdown("## 📤 Upload Your Keyword File in CSV")
 
 uploaded_file = st.file_uploader("Upload a CSV with a 'Keyword' column", type=["csv"])
 if uploaded_file:
-    df = load_and_clean_file(uploaded_file)
-    if df is not None:
-        st.session_state["original_df"] = df
-        st.session_state["original_count"] = len(df)
+    # Parse once per upload; job polling reruns this script every second
+    upload_id = getattr(uploaded_file, "file_id", None) or (
+        uploaded_file.name,
+        uploaded_file.size,
+    )
+    if st.session_state.get("upload_id") != upload_id:
+        df = load_and_clean_file(uploaded_file)
+        if df is not None:
+            st.session_state["original_df"] = df
+            st.session_state["original_count"] = len(df)
+            st.session_state["upload_id"] = upload_id
+    if st.session_state.get("upload_id") == upload_id:
         st.success(f"✅ File loaded: {st.session_state['original_count']} rows total")
-        st.dataframe(df.head(10))
+        st.dataframe(st.session_state["original_df"].head(10))
 
 st.markdown("## 🧠 Define Sentiment Meaning")
 st.session_state["positive_intent"] = st.text_input(
@@ -63,81 +87,169 @@ st.session_state["negative_intent"] = st.text_input(
     value="Users expressing problems, issues, or confusion",
 )
 
+# Per-session, so cached stage results are never shared between users
+if "stage_cache" not in st.session_state:
+    st.session_state["stage_cache"] = StageCache()
+stage_cache = st.session_state["stage_cache"]
+
 if "original_df" in st.session_state:
     st.markdown("## 🧹 Filter Settings")
     user_input = st.text_input(
         "Enter unwanted words to filter (comma-separated)", value="free, help, download"
     )
+    fold_plurals = st.checkbox(
+        "Treat singular/plural variants as the same keyword", value=False
+    )
+    refresh_labels = st.checkbox(
+        "Ignore cached intent labels and ask the LLM again", value=False
+    )
     min_k = st.number_input("📉 Minimum keywords per group", min_value=1, value=5)
     max_k = st.number_input(
         "📈 Maximum keywords per group", min_value=min_k + 1, value=20
     )
 
-    if st.button("🚀 Clean & Group"):
-        with st.spinner("Filtering and grouping..."):
-            df_input = st.session_state["original_df"]
-            df_no_questions, df_removed_questions = filter_questions(df_input)
-            word_list = [w.strip() for w in user_input.split(",") if w.strip()]
-            df_cleaned, df_removed_patterns_all = filter_patterns(
-                df_no_questions.copy(), word_list
-            )
-            df_removed_patterns = df_removed_patterns_all[
-                ~df_removed_patterns_all["Keyword"].isin(
-                    df_removed_questions["Keyword"]
-                )
-            ]
-
-            final_count = len(df_cleaned)
-            expected = (
-                st.session_state["original_count"]
-                - len(df_removed_questions)
-                - len(df_removed_patterns)
-            )
-            st.success(
-                f"✅ Final rows after all filtering: {final_count} (Expected: {expected})"
-            )
-
-            st.session_state["final_clean_df"] = df_cleaned
-            st.session_state["removed_questions"] = df_removed_questions
-            st.session_state["removed_patterns"] = df_removed_patterns
-
-            df_clustered, embeddings, centers, df_misc = cluster_keywords(
-                df_cleaned, min_k, max_k
-            )
-            st.session_state["max_keywords_per_group"] = max_k
-
-            df_labeled = label_all_clusters(df_clustered, embeddings, centers)
+    # Weekly deltas join the groups already on screen instead of regrouping
+    append = st.session_state.get("loaded_job") and st.checkbox(
+        "➕ Add these keywords to the current grouping", value=False
+    )
 
-            df_labeled = assign_cluster_sentiment(
-                df_labeled,
-                st.session_state["positive_intent"],
-                st.session_state["negative_intent"],
-            )
+    if st.button("🚀 Clean & Group"):
+        from pipeline import RESULT_KEYS
+
+        word_list = [w.strip() for w in user_input.split(",") if w.strip()]
+        previous = (
+            {key: st.session_state[key] for key in RESULT_KEYS} if append else None
+        )
+        # Runs in the background; resubmitting the same inputs resumes it
+        job_id = submit_job(
+            st.session_state["username"],
+            st.session_state["original_df"],
+            word_list,
+            min_k,
+            max_k,
+            st.session_state["positive_intent"],
+            st.session_state["negative_intent"],
+            fold_plurals=fold_plurals,
+            run_stage=stage_cache.run,
+            previous=previous,
+            refresh_labels=refresh_labels,
+        )
+        st.session_state["job_id"] = job_id
+        st.session_state.pop("loaded_job", None)
+        st.session_state["max_keywords_per_group"] = max_k
+        st.query_params["job"] = job_id
+
+# The job id lives in the URL too, so a refreshed page finds its job again
+job_id = st.session_state.get("job_id") or st.query_params.get("job")
+job = job_status(job_id, st.session_state["username"]) if job_id else None
+if job is not None and job["state"] in ("queued", "running"):
+    st.markdown("## ⏳ Grouping in Progress")
+    st.progress(job["fraction"])
+    st.markdown(f"**{job['stage'] or 'queued'}** · {job['message']}")
+    time.sleep(JOB_POLL_SECONDS)
+    st.rerun()
+elif job is not None and job["state"] in ("failed", "interrupted"):
+    done = [name for name, state in job["stages"].items() if state != "running"]
+    st.error(
+        f"❌ Grouping {job['state']}: {job['error'] or 'the server restarted'}. "
+        f"Click Clean & Group again to resume after {', '.join(done) or 'the start'}."
+    )
+elif job is not None and st.session_state.get("loaded_job") != job_id:
+    results = job_result(job_id, st.session_state["username"])
+    if results is not None:
+        st.session_state.update(results)
+        st.session_state.pop("report_key", None)
+        st.session_state["loaded_job"] = job_id
+        st.session_state["job_stages"] = job["stages"]
+
+profile = job.get("profile") if job is not None else None
+if profile:
+    st.sidebar.markdown("### 📊 Run Profile")
+    st.sidebar.dataframe(
+        pd.DataFrame(profile["stages"])[
+            ["stage", "seconds", "cpu_seconds", "rows_in", "rows_out", "peak_rss_mb"]
+        ],
+        hide_index=True,
+    )
+    llm = profile["openai"]
+    st.sidebar.caption(
+        f"🤖 OpenAI: {llm['requests']} requests, {llm['retries']} retries, "
+        f"{llm['prompt_tokens'] + llm['completion_tokens']} tokens, "
+        f"p50 {llm['latency_p50']}s / p90 {llm['latency_p90']}s"
+    )
+    caches = profile["caches"]
+    st.sidebar.caption(
+        f"🗃️ Cache hit rates: embeddings {caches['embedding_hit_rate']}, "
+        f"labels {caches['label_hit_rate']}, "
+        f"{caches['label_semantic_reuse']} labels reused from similar clusters"
+    )
+    st.sidebar.caption(f"⏱️ Total {profile['seconds']}s · run `{profile['run_id']}`")
 
-            st.session_state["final_df"] = df_labeled
-            st.session_state["misc_keywords"] = df_misc
+if st.session_state.get("loaded_job") and "final_df" in st.session_state:
+    from utils import plot_intent_distribution
 
-            st.success("🎯 Grouping complete!")
-            st.dataframe(df_labeled.head())
-            st.markdown("### 📈 Intent Distribution")
-            plot_intent_distribution(df_labeled)
+    df_labeled = st.session_state["final_df"]
+    df_misc = st.session_state.get("misc_keywords", pd.DataFrame())
+    st.success(
+        "✅ Final rows after all filtering: "
+        f"{len(st.session_state['final_clean_df'])} "
+        f"(Expected: {st.session_state['expected_count']})"
+    )
+    st.success("🎯 Grouping complete!")
+    stage_status = {
+        "checkpoint": "💾 resumed",
+        "cached": "♻️ cached",
+        "done": "🔄 ran",
+    }
+    st.caption(
+        "Stages: "
+        + " · ".join(
+            f"{name} {stage_status.get(state, '')}"
+            for name, state in st.session_state.get("job_stages", {}).items()
+        )
+    )
+    st.dataframe(df_labeled.head())
+    st.markdown("### 📈 Intent Distribution")
+    plot_intent_distribution(df_labeled)
 
-            if not df_misc.empty:
-                st.warning(f"⚠️ {len(df_misc)} keywords moved to Miscellaneous.")
-                st.dataframe(df_misc.head())
+    if not df_misc.empty:
+        st.warning(f"⚠️ {len(df_misc)} keywords moved to Miscellaneous.")
+        st.dataframe(df_misc.head())
 
 if "final_df" in st.session_state:
-    st.markdown("## 💾 Download All Processed Data (Excel)")
-    dfs_to_export = {
-        "Final_Clustered_Keywords": st.session_state["final_df"],
-        "Removed_Questions": st.session_state.get("removed_questions", pd.DataFrame()),
-        "Removed_Patterns": st.session_state.get("removed_patterns", pd.DataFrame()),
-        "Cleaned_Keywords": st.session_state.get("final_clean_df", pd.DataFrame()),
-    }
-    excel_buffer = export_data_to_excel(dfs_to_export)
-    st.download_button(
-        label="⬇️ Download Full Excel Report",
-        data=excel_buffer,
-        file_name="keyword_intelligence.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    from pipeline import report_frames
+
+    st.markdown("## 💾 Download All Processed Data")
+    report_format = st.selectbox(
+        "Report format",
+        list(REPORT_DOWNLOADS),
+        format_func={
+            "xlsx": "Excel workbook",
+            "parquet": "Parquet files (zip)",
+            "csv.zip": "CSV files (zip)",
+        }.get,
     )
+    # The report is only built on request, in the background, and memoized
+    if st.button("📦 Prepare Report"):
+        st.session_state["report_key"], _ = request_report(
+            report_frames(st.session_state),
+            st.session_state.get("max_keywords_per_group", 100),
+            st.session_state.get("misc_keywords", pd.DataFrame()),
+            fmt=report_format,
+        )
+        st.session_state["report_format"] = report_format
+
+    report_future = get_report(st.session_state.get("report_key"))
+    if report_future is not None and not report_future.done():
+        st.info("⏳ Building the report in the background...")
+        st.button("🔄 Check report status")
+    elif report_future is not None and report_future.exception():
+        st.error(f"❌ Report failed: {report_future.exception()}")
+    elif report_future is not None:
+        file_name, mime = REPORT_DOWNLOADS[st.session_state["report_format"]]
+        st.download_button(
+            label="⬇️ Download Full Report",
+            data=open_report(report_future.result()),
+            file_name=file_name,
+            mime=mime,
+        )
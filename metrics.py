@@ -0,0 +1,249 @@
+"""Per-run instrumentation of the pipeline stages.
+
+Stage functions are wrapped with ``@instrument("name")``. While a
+``RunMetrics`` is active (see ``activate``), every call records its wall
+time, process CPU time, peak RSS, and rows in and out. Modules report
+counters with ``record`` and samples with ``observe``, for example OpenAI
+request latencies or embedding-cache hits. Outside an active run all of
+these are no-ops, so stages called directly (tests, notebooks, workers)
+pay nothing.
+
+``KEYWORD_PROFILE=cprofile`` also saves a cProfile dump of each run, and
+``KEYWORD_PROFILE=py-spy`` records the run with ``py-spy`` if it is
+installed. Both are written next to the run's JSON log in
+``KEYWORD_RUN_LOG_DIR``.
+"""
+
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+RUN_LOG_DIR = os.environ.get("KEYWORD_RUN_LOG_DIR", os.path.join(".cache", "runs"))
+PROFILE_MODE = os.environ.get("KEYWORD_PROFILE", "").lower()
+
+_current = contextvars.ContextVar("run_metrics", default=None)
+
+
+def _current_rss_mb():
+    from models import _current_rss_mb as rss
+
+    return rss()
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 4)
+
+
+def _rows(value):
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if hasattr(value, "shape") and getattr(value, "ndim", 0) >= 1:
+        return int(value.shape[0])
+    return None
+
+
+class PeakRSS:
+    """Samples resident memory on a thread while a block runs."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _current_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class RunMetrics:
+    """Stage timings, counters and samples for one pipeline run."""
+
+    def __init__(self, run_id=None, log_dir=RUN_LOG_DIR):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.log_dir = log_dir
+        self.started = time.time()
+        self.stages = []
+        self.counters = {}
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, value=1):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, key, values):
+        with self._lock:
+            self.samples.setdefault(key, []).extend(values)
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        entry = {"stage": name, "rows_in": rows_in, "rows_out": None}
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            with PeakRSS() as rss:
+                yield entry
+        finally:
+            entry["seconds"] = round(time.perf_counter() - wall, 4)
+            entry["cpu_seconds"] = round(time.process_time() - cpu, 4)
+            entry["peak_rss_mb"] = round(rss.peak, 1)
+            with self._lock:
+                self.stages.append(entry)
+
+    def summary(self):
+        from models import get_model_stats
+
+        with self._lock:
+            counters = dict(self.counters)
+            samples = {k: list(v) for k, v in self.samples.items()}
+            stages = [dict(s) for s in self.stages]
+
+        def rate(hits, misses):
+            total = counters.get(hits, 0) + counters.get(misses, 0)
+            return round(counters.get(hits, 0) / total, 4) if total else None
+
+        latencies = samples.get("openai_latency_seconds", [])
+        return {
+            "run_id": self.run_id,
+            "started": self.started,
+            "seconds": round(time.time() - self.started, 3),
+            "stages": stages,
+            "openai": {
+                "requests": counters.get("openai_requests", 0),
+                "retries": counters.get("openai_retries", 0),
+                "prompt_tokens": counters.get("openai_prompt_tokens", 0),
+                "completion_tokens": counters.get("openai_completion_tokens", 0),
+                "latency_p50": _percentile(latencies, 50),
+                "latency_p90": _percentile(latencies, 90),
+                "latency_p99": _percentile(latencies, 99),
+            },
+            "caches": {
+                "embedding_hit_rate": rate(
+                    "embedding_cache_hits", "embedding_cache_misses"
+                ),
+                "label_hit_rate": rate("label_cache_hits", "label_cache_misses"),
+                "label_semantic_reuse": counters.get("label_semantic_hits", 0),
+                "stage_cache_hits": counters.get("stage_cache_hits", 0),
+            },
+            "models": get_model_stats(),
+            "counters": counters,
+        }
+
+    def write_json(self, path=None):
+        path = path or os.path.join(self.log_dir, f"{self.run_id}.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2, default=str)
+        return path
+
+
+def current():
+    """The run being measured in this context, or ``None``."""
+    return _current.get()
+
+
+def record(key, value=1):
+    run = _current.get()
+    if run is not None:
+        run.record(key, value)
+
+
+def observe(key, values):
+    run = _current.get()
+    if run is not None:
+        run.observe(key, values)
+
+
+@contextmanager
+def _profiled(run):
+    os.makedirs(run.log_dir, exist_ok=True)
+    base = os.path.join(run.log_dir, run.run_id)
+    if PROFILE_MODE == "cprofile":
+        # Covers the thread that runs the stages, not model worker threads
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(f"{base}.prof")
+            print(f"🔬 cProfile written to {base}.prof")
+    elif PROFILE_MODE == "py-spy" and shutil.which("py-spy"):
+        spy = subprocess.Popen(
+            [
+                "py-spy",
+                "record",
+                "--pid",
+                str(os.getpid()),
+                "--format",
+                "speedscope",
+                "--output",
+                f"{base}.speedscope.json",
+                "--threads",
+            ]
+        )
+        try:
+            yield
+        finally:
+            spy.terminate()
+            spy.wait()
+            print(f"🔬 py-spy profile written to {base}.speedscope.json")
+    else:
+        yield
+
+
+@contextmanager
+def activate(run):
+    """Measure everything called in this context into ``run``.
+
+    The JSON log is written when the block exits, even if the run failed.
+    """
+    token = _current.set(run)
+    try:
+        with _profiled(run):
+            yield run
+    finally:
+        _current.reset(token)
+        path = run.write_json()
+        print(f"📊 Run profile written to {path}")
+
+
+def instrument(name):
+    """Decorator that records calls of a stage function in the active run."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            run = _current.get()
+            if run is None:
+                return fn(*args, **kwargs)
+            rows_in = _rows(args[0]) if args else None
+            with run.stage(name, rows_in) as entry:
+                result = fn(*args, **kwargs)
+                entry["rows_out"] = _rows(result)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -1,34 +1,140 @@
-# Hugging Face tools for model loading and inference
-from transformers import (
-    AutoTokenizer,
-    AutoModelForSequenceClassification,
-    pipeline,
-)
+import os
+import threading
+import time
 
-# For loading sentence embedding models
-from sentence_transformers import (
-    SentenceTransformer,
-)
+import metrics
 
+# transformers / sentence_transformers / torch are imported inside the
+# builders so importing this module (e.g. before login) stays cheap
 
-# Load a fine-tuned model pipeline for detecting whether text is a question
-def load_question_classifier():
+QUESTION_MODEL_NAME = "mrsinghania/asr-question-detection"
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# "torch" (default) or "onnx" for the ONNX Runtime CPU backend
+INFERENCE_BACKEND = os.environ.get("KEYWORD_INFERENCE_BACKEND", "torch").lower()
+
+# Process-wide registry: every Streamlit session and thread shares one copy
+_registry = {}
+_registry_stats = {}
+_registry_lock = threading.Lock()
+_model_locks = {}
+_warmup_thread = None
+
+
+def _current_rss_mb():
+    # Resident set size of this process, read from /proc where available
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _get_or_load(name, loader):
+    if name in _registry:
+        return _registry[name]
+
+    with _registry_lock:
+        lock = _model_locks.setdefault(name, threading.Lock())
+
+    # Per-model lock so two sessions never load the same weights twice
+    with lock:
+        if name not in _registry:
+            rss_before = _current_rss_mb()
+            start = time.time()
+            _registry[name] = loader()
+            _registry_stats[name] = {
+                "load_seconds": round(time.time() - start, 2),
+                "rss_delta_mb": round(_current_rss_mb() - rss_before, 1),
+            }
+            metrics.record("model_load_seconds", _registry_stats[name]["load_seconds"])
+            print(
+                f"📦 Loaded {name} in {_registry_stats[name]['load_seconds']}s "
+                f"(+{_registry_stats[name]['rss_delta_mb']} MB)"
+            )
+    return _registry[name]
+
+
+def _build_question_classifier():
+    # Hugging Face tools for model loading and inference
+    from transformers import (
+        AutoTokenizer,
+        AutoModelForSequenceClassification,
+        pipeline,
+    )
 
     # Load tokenizer specific to the question detection model
-    tokenizer = AutoTokenizer.from_pretrained("mrsinghania/asr-question-detection")
+    tokenizer = AutoTokenizer.from_pretrained(QUESTION_MODEL_NAME)
 
     # Load the fine-tuned transformer model for classification
-    model = AutoModelForSequenceClassification.from_pretrained(
-        "mrsinghania/asr-question-detection"
-    )
+    model = AutoModelForSequenceClassification.from_pretrained(QUESTION_MODEL_NAME)
 
     # Create a text classification pipeline with the model and tokenizer
-    classifier = pipeline(
+    return pipeline(
         "text-classification", model=model, tokenizer=tokenizer, top_k=None
     )
-    return classifier  # Return the pipeline for inference use
+
+
+def _build_embedding_model():
+    # For loading sentence embedding models
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+
+# Load a fine-tuned model pipeline for detecting whether text is a question
+def load_question_classifier():
+    if INFERENCE_BACKEND == "onnx":
+        from onnx_backend import OnnxQuestionClassifier
+
+        return _get_or_load(
+            f"{QUESTION_MODEL_NAME}:onnx",
+            lambda: OnnxQuestionClassifier(QUESTION_MODEL_NAME),
+        )
+    return _get_or_load(QUESTION_MODEL_NAME, _build_question_classifier)
 
 
 # Load a lightweight sentence embedding model for semantic similarity and vector-based tasks
 def load_embedding_model():
-    return SentenceTransformer("all-MiniLM-L6-v2")
+    if INFERENCE_BACKEND == "onnx":
+        from onnx_backend import OnnxSentenceEncoder
+
+        return _get_or_load(
+            f"{EMBEDDING_MODEL_NAME}:onnx",
+            lambda: OnnxSentenceEncoder(EMBEDDING_MODEL_NAME),
+        )
+    return _get_or_load(EMBEDDING_MODEL_NAME, _build_embedding_model)
+
+
+def warm_up_models(background=True):
+    """Load every registered model ahead of first use.
+
+    With ``background=True`` loading happens on a daemon thread and the
+    thread is returned; callers that need a model still block on its lock.
+    """
+    global _warmup_thread
+
+    def _load_all():
+        for loader in (load_question_classifier, load_embedding_model):
+            try:
+                loader()
+            except Exception as e:
+                print(f"⚠️ Model warm-up failed: {e}")
+
+    if not background:
+        _load_all()
+        return None
+    with _registry_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(
+                target=_load_all, name="model-warmup", daemon=True
+            )
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+def get_model_stats():
+    """Return load time and resident-memory growth for each loaded model."""
+    return {name: dict(stats) for name, stats in _registry_stats.items()}
@@ -0,0 +1,65 @@
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from metrics import instrument
+
+CANONICAL_COLUMN = "Canonical_Keyword"
+
+_SPACES = re.compile(r"\s+")
+# Punctuation that carries meaning in keywords ("c#", "b&q") is kept
+_KEPT_PUNCTUATION = {"#", "&"}
+
+
+def _fold_plural(token):
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("sses", "shes", "ches", "xes")):
+        return token[:-2]
+    if len(token) > 3 and token[-1] == "s" and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def canonical_keyword(text, fold_plurals=False):
+    """Case-, width-, whitespace- and punctuation-insensitive form of a keyword."""
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    text = text.replace("'", "").replace("’", "")
+    text = "".join(
+        " "
+        if unicodedata.category(ch)[0] == "P" and ch not in _KEPT_PUNCTUATION
+        else ch
+        for ch in text
+    )
+    text = _SPACES.sub(" ", text).strip()
+    if fold_plurals:
+        text = " ".join(_fold_plural(token) for token in text.split(" "))
+    return text
+
+
+@instrument("normalize")
+def add_canonical_keywords(df, fold_plurals=False):
+    """Add the canonical form of every keyword as ``Canonical_Keyword``."""
+    cache = {}
+    canon = []
+    for keyword in df["Keyword"].tolist():
+        if keyword not in cache:
+            cache[keyword] = canonical_keyword(keyword, fold_plurals)
+        canon.append(cache[keyword])
+    df[CANONICAL_COLUMN] = canon
+    unique = len(set(canon))
+    print(f"🧬 {len(canon)} keywords normalized to {unique} canonical forms")
+    return df
+
+
+def canonical_groups(df):
+    """Return ``(unique_forms, inverse)`` so ``unique_forms[inverse]`` rebuilds rows.
+
+    Uses ``Canonical_Keyword`` when the frame has been normalized and the
+    raw keyword otherwise, so unnormalized frames still work.
+    """
+    column = CANONICAL_COLUMN if CANONICAL_COLUMN in df.columns else "Keyword"
+    inverse, unique = pd.factorize(df[column].astype(str), sort=False)
+    return np.asarray(unique, dtype=object), inverse
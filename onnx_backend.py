@@ -0,0 +1,264 @@
+"""ONNX Runtime CPU backend for the question classifier and embedding model.
+
+Both Hugging Face models are exported to ONNX on first use (optionally with
+dynamic int8 quantization) and run through a thread-tuned ONNX Runtime
+session. The wrappers mimic the call signatures of the PyTorch objects
+they replace, so ``processor`` and ``sentiment_helper`` need no changes.
+
+Select it with ``KEYWORD_INFERENCE_BACKEND=onnx``; check accuracy against
+PyTorch with ``python onnx_backend.py --check``. It needs the ``onnx``
+and ``onnxruntime`` packages, listed as optional (commented out) in
+requirements.txt.
+"""
+
+import argparse
+import inspect
+import json
+import os
+
+import numpy as np
+
+ONNX_DIR = os.environ.get("KEYWORD_ONNX_DIR", os.path.join(".cache", "onnx"))
+QUANTIZE = os.environ.get("KEYWORD_ONNX_QUANTIZE", "1") not in ("0", "false", "")
+INTRA_OP_THREADS = int(
+    os.environ.get("KEYWORD_ONNX_THREADS", os.cpu_count() or 1)
+)
+OPSET = 17
+# Bump to re-export models whose cached ONNX files were exported wrongly
+EXPORT_VERSION = 2
+
+# Fixed sample for accuracy-parity checks between the two backends
+PARITY_KEYWORDS = [
+    "plumber near me",
+    "how to fix a leaking tap",
+    "emergency plumber london",
+    "what is a combi boiler",
+    "boiler repair cost",
+    "can i replace a radiator myself",
+    "best bathroom fitters",
+    "why is my water pressure low",
+    "blocked drain service",
+    "is it worth fixing an old boiler",
+    "cheap boiler installation",
+    "where is the stopcock",
+    "24 hour plumber",
+    "does a new boiler need a permit",
+    "kitchen sink installation",
+    "tell me about heat pumps",
+]
+
+
+def _hub_name(model_name):
+    # sentence-transformers short names live under the sentence-transformers org
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def _model_dir(model_name):
+    name = _hub_name(model_name).replace("/", "__")
+    return os.path.join(ONNX_DIR, f"{name}__v{EXPORT_VERSION}")
+
+
+def _export(model_name, model_cls, output_names, quantize):
+    """Export ``model_name`` to ONNX once and return the model file path."""
+    from transformers import AutoTokenizer
+
+    out_dir = _model_dir(model_name)
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    int8_path = os.path.join(out_dir, "model.int8.onnx")
+    target = int8_path if quantize else fp32_path
+    if os.path.exists(target):
+        return target
+
+    if not os.path.exists(fp32_path):
+        import torch
+
+        os.makedirs(out_dir, exist_ok=True)
+        hub_name = _hub_name(model_name)
+        tokenizer = AutoTokenizer.from_pretrained(hub_name)
+        model = model_cls.from_pretrained(hub_name, return_dict=False).eval()
+        sample = dict(tokenizer(["export sample"], return_tensors="pt"))
+        # Graph inputs follow forward()'s parameter order, not the tokenizer's
+        params = inspect.signature(model.forward).parameters
+        input_names = [name for name in params if name in sample]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes.update({name: {0: "batch"} for name in output_names})
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                # A trailing dict is bound to forward() by keyword
+                ({name: sample[name] for name in input_names},),
+                fp32_path,
+                input_names=input_names,
+                output_names=output_names,
+                dynamic_axes=dynamic_axes,
+                opset_version=OPSET,
+            )
+        print(f"📤 Exported {model_name} to {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"🗜️ Quantized {model_name} to {int8_path}")
+    return target
+
+
+def _session(path, threads=INTRA_OP_THREADS):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def _feed(session, encoded):
+    names = {i.name for i in session.get_inputs()}
+    return {k: v.astype(np.int64) for k, v in encoded.items() if k in names}
+
+
+class OnnxQuestionClassifier:
+    """Drop-in for the ``text-classification`` pipeline with ``top_k=None``."""
+
+    def __init__(self, model_name, quantize=QUANTIZE, threads=INTRA_OP_THREADS):
+        from transformers import AutoConfig, AutoModelForSequenceClassification
+        from transformers import AutoTokenizer
+
+        path = _export(
+            model_name, AutoModelForSequenceClassification, ["logits"], quantize
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.id2label = AutoConfig.from_pretrained(model_name).id2label
+        self.session = _session(path, threads)
+
+    def __call__(self, texts, batch_size=64, truncation=True, max_length=None, **_):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        results = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start: start + batch_size],
+                padding=True,
+                truncation=truncation,
+                max_length=max_length,
+                return_tensors="np",
+            )
+            logits = self.session.run(["logits"], _feed(self.session, encoded))[0]
+            logits = logits - logits.max(axis=1, keepdims=True)
+            probs = np.exp(logits)
+            probs /= probs.sum(axis=1, keepdims=True)
+            for row in probs:
+                results.append(
+                    sorted(
+                        (
+                            {"label": self.id2label[i], "score": float(p)}
+                            for i, p in enumerate(row)
+                        ),
+                        key=lambda y: y["score"],
+                        reverse=True,
+                    )
+                )
+        return results[0] if single else results
+
+
+class OnnxSentenceEncoder:
+    """Drop-in for ``SentenceTransformer.encode`` (mean pooling + L2 norm)."""
+
+    def __init__(
+        self, model_name, quantize=QUANTIZE, threads=INTRA_OP_THREADS, max_length=256
+    ):
+        from transformers import AutoModel, AutoTokenizer
+
+        path = _export(model_name, AutoModel, ["last_hidden_state"], quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(_hub_name(model_name))
+        self.session = _session(path, threads)
+        self.max_length = max_length
+        # Keeps these vectors apart from PyTorch ones in the embedding cache
+        suffix = "-int8" if quantize else ""
+        self.cache_name = f"{model_name}:onnx{suffix}-v{EXPORT_VERSION}"
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, **_):
+        sentences = [str(s) for s in sentences]
+        vectors = []
+        for start in range(0, len(sentences), batch_size):
+            encoded = self.tokenizer(
+                sentences[start: start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            hidden = self.session.run(
+                ["last_hidden_state"], _feed(self.session, encoded)
+            )[0]
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            vectors.append(pooled / np.maximum(norms, 1e-12))
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(vectors).astype(np.float32)
+
+
+def check_parity(keywords=PARITY_KEYWORDS, quantize=QUANTIZE):
+    """Compare ONNX outputs with the PyTorch models on a fixed keyword sample."""
+    from models import (
+        QUESTION_MODEL_NAME,
+        EMBEDDING_MODEL_NAME,
+        _build_question_classifier,
+    )
+    from sentence_transformers import SentenceTransformer
+
+    torch_clf = _build_question_classifier()
+    onnx_clf = OnnxQuestionClassifier(QUESTION_MODEL_NAME, quantize=quantize)
+    session_inputs = {i.name for i in onnx_clf.session.get_inputs()}
+    tokenizer_inputs = set(onnx_clf.tokenizer(["probe"], return_tensors="np"))
+    torch_out = torch_clf(keywords, truncation=True)
+    onnx_out = onnx_clf(keywords, truncation=True)
+    torch_top = [max(o, key=lambda y: y["score"]) for o in torch_out]
+    onnx_top = [max(o, key=lambda y: y["score"]) for o in onnx_out]
+    label_agreement = np.mean(
+        [t["label"] == o["label"] for t, o in zip(torch_top, onnx_top)]
+    )
+    score_diff = max(
+        abs(t["score"] - o["score"]) for t, o in zip(torch_top, onnx_top)
+    )
+
+    torch_vecs = SentenceTransformer(EMBEDDING_MODEL_NAME).encode(
+        keywords, normalize_embeddings=True
+    )
+    onnx_vecs = OnnxSentenceEncoder(EMBEDDING_MODEL_NAME, quantize=quantize).encode(
+        keywords
+    )
+    cosines = (torch_vecs * onnx_vecs).sum(axis=1)
+    return {
+        "quantized": quantize,
+        "inputs_match_tokenizer": session_inputs <= tokenizer_inputs,
+        "question_label_agreement": float(label_agreement),
+        "question_max_score_diff": float(score_diff),
+        "embedding_min_cosine": float(cosines.min()),
+        "embedding_mean_cosine": float(cosines.mean()),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ONNX backend utilities")
+    parser.add_argument("--check", action="store_true", help="run the parity check")
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    parser.add_argument("--max-score-diff", type=float, default=0.05)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    args = parser.parse_args()
+    if args.check:
+        report = check_parity(quantize=not args.no_quantize)
+        print(json.dumps(report, indent=2))
+        ok = (
+            report["inputs_match_tokenizer"]
+            and report["question_label_agreement"] >= args.min_agreement
+            and report["question_max_score_diff"] <= args.max_score_diff
+            and report["embedding_min_cosine"] >= args.min_cosine
+        )
+        raise SystemExit(0 if ok else 1)
+    parser.print_help()
@@ -0,0 +1,127 @@
+"""Aho–Corasick matching of many literal terms against keywords.
+
+One automaton is built per term list and every keyword is scanned once,
+however many terms there are. Terms are literals, so regex metacharacters
+in user input are matched as typed.
+
+Modes:
+    substring  term may appear anywhere (the old ``str.contains`` behavior)
+    word       term must sit on word boundaries at both ends
+    prefix     term must start the keyword and end on a word boundary
+"""
+
+from collections import deque
+from functools import lru_cache
+
+MODES = ("substring", "word", "prefix")
+
+
+def normalize_for_matching(text):
+    return str(text).strip().lower()
+
+
+def _is_missing(value):
+    # NaN != NaN; pandas.NA compares to NA, whose truth value raises
+    try:
+        return value is None or bool(value != value)
+    except TypeError:
+        return True
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+class KeywordMatcher:
+    def __init__(self, terms, mode="substring"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown match mode {mode!r}; expected one of {MODES}")
+        self.mode = mode
+        self.terms = list(
+            dict.fromkeys(normalize_for_matching(t) for t in terms if str(t).strip())
+        )
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for index, term in enumerate(self.terms):
+            self._insert(term, index)
+        self._build_failure_links()
+        self._max_len = max((len(t) for t in self.terms), default=0)
+
+    def _insert(self, term, index):
+        node = 0
+        for ch in term:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(index)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                if self._fail[child] == child:
+                    self._fail[child] = 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _accepts(self, text, start, end):
+        term = text[start:end]
+        if self.mode == "prefix" and start != 0:
+            return False
+        if self.mode in ("word", "prefix") and _is_word_char(term[-1]):
+            if end < len(text) and _is_word_char(text[end]):
+                return False
+        if self.mode == "word" and _is_word_char(term[0]):
+            if start > 0 and _is_word_char(text[start - 1]):
+                return False
+        return True
+
+    def first_match(self, text):
+        """Return the first term matched in ``text`` (normalized), or ``None``."""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for index in out[node]:
+                term = self.terms[index]
+                if self._accepts(text, i + 1 - len(term), i + 1):
+                    return term
+            if self.mode == "prefix" and i >= self._max_len:
+                break
+        return None
+
+    def match_many(self, texts):
+        """Return the matching term (or ``None``) for each text.
+
+        Missing values (``None``, NaN) never match, rather than being
+        matched as the string ``"nan"``.
+        """
+        if not self.terms:
+            return [None] * len(texts)
+        return [
+            None if _is_missing(t) else self.first_match(normalize_for_matching(t))
+            for t in texts
+        ]
+
+
+@lru_cache(maxsize=32)
+def _cached_matcher(terms, mode):
+    return KeywordMatcher(terms, mode)
+
+
+def build_matcher(terms, mode="substring"):
+    """Return a compiled matcher, reusing one already built for these terms."""
+    return _cached_matcher(tuple(terms), mode)
@@ -0,0 +1,206 @@
+import pandas as pd
+
+from processor import (
+    filter_questions,
+    filter_patterns,
+    embed_keywords,
+    cluster_keywords,
+    cluster_incremental,
+)
+from intent import label_all_clusters, label_changed_clusters
+from sentiment_helper import assign_cluster_sentiment
+from normalize import add_canonical_keywords
+
+
+PIPELINE_STAGES = [
+    "normalize",
+    "question_filter",
+    "pattern_filter",
+    "embedding",
+    "clustering",
+    "labeling",
+    "sentiment",
+]
+
+# Keys of the dict returned by run_pipeline and run_incremental
+RESULT_KEYS = [
+    "final_clean_df",
+    "removed_questions",
+    "removed_patterns",
+    "final_df",
+    "misc_keywords",
+    "expected_count",
+]
+
+
+def _call_stage(name, fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+def _filter(df, words_to_filter, fold_plurals, progress, run_stage):
+    original_count = len(df)
+    # Later stages run inference once per canonical form, not per variant
+    df = run_stage(
+        "normalize", add_canonical_keywords, df.copy(), fold_plurals=fold_plurals
+    )
+    df_no_questions, df_removed_questions = run_stage(
+        "question_filter", filter_questions, df, progress=progress
+    )
+    df_cleaned, df_removed_patterns_all = run_stage(
+        "pattern_filter", filter_patterns, df_no_questions.copy(), words_to_filter
+    )
+    df_removed_patterns = df_removed_patterns_all
+    if "Keyword" in df_removed_patterns_all.columns:
+        df_removed_patterns = df_removed_patterns_all[
+            ~df_removed_patterns_all["Keyword"].isin(df_removed_questions["Keyword"])
+        ]
+    expected = original_count - len(df_removed_questions) - len(df_removed_patterns)
+    print(
+        f"✅ Final rows after all filtering: {len(df_cleaned)} (Expected: {expected})"
+    )
+    return df_cleaned, df_removed_questions, df_removed_patterns, expected
+
+
+def run_pipeline(
+    df,
+    words_to_filter,
+    min_k,
+    max_k,
+    positive_intent,
+    negative_intent,
+    progress=None,
+    fold_plurals=False,
+    run_stage=None,
+    refresh_labels=False,
+):
+    """Run every stage after loading and return the frames the report needs.
+
+    Keys of the returned dict match the session-state keys used by the
+    Streamlit app so both front ends can hand them to the exporter.
+    ``run_stage(name, fn, *args, **kwargs)`` wraps each stage call, e.g.
+    ``StageCache.run`` to skip stages whose inputs have not changed.
+    ``refresh_labels`` asks the LLM again instead of reusing cached labels.
+    """
+    if run_stage is None:
+        run_stage = _call_stage
+    df_cleaned, df_removed_questions, df_removed_patterns, expected = _filter(
+        df, words_to_filter, fold_plurals, progress, run_stage
+    )
+
+    embeddings = run_stage(
+        "embedding", embed_keywords, df_cleaned, progress=progress
+    )
+    df_clustered, embeddings, centers, df_misc = run_stage(
+        "clustering", cluster_keywords, df_cleaned, min_k, max_k, embeddings=embeddings
+    )
+    df_labeled = run_stage(
+        "labeling",
+        label_all_clusters,
+        df_clustered,
+        embeddings,
+        centers,
+        progress=progress,
+        force_refresh=refresh_labels,
+    )
+    df_labeled = run_stage(
+        "sentiment",
+        assign_cluster_sentiment,
+        df_labeled,
+        positive_intent,
+        negative_intent,
+    )
+
+    return {
+        "final_clean_df": df_cleaned,
+        "removed_questions": df_removed_questions,
+        "removed_patterns": df_removed_patterns,
+        "final_df": df_labeled,
+        "misc_keywords": df_misc,
+        "expected_count": expected,
+    }
+
+
+def run_incremental(
+    df,
+    previous,
+    words_to_filter,
+    min_k,
+    max_k,
+    positive_intent,
+    negative_intent,
+    progress=None,
+    fold_plurals=False,
+    run_stage=None,
+    refresh_labels=False,
+):
+    """Add newly uploaded keywords to the grouping in ``previous``.
+
+    ``previous`` is a results dict from an earlier ``run_pipeline`` (or
+    ``run_incremental``). Only new keywords are filtered and embedded and
+    only new or changed clusters are sent to the LLM. The returned dict has
+    the same keys as ``run_pipeline``'s and covers old and new keywords.
+    """
+    if run_stage is None:
+        run_stage = _call_stage
+    df_cleaned, df_removed_questions, df_removed_patterns, expected = _filter(
+        df, words_to_filter, fold_plurals, progress, run_stage
+    )
+    df_clustered, embeddings, centers, df_misc, relabel = run_stage(
+        "clustering",
+        cluster_incremental,
+        df_cleaned,
+        previous["final_df"],
+        min_k,
+        max_k,
+        previous_misc=previous.get("misc_keywords"),
+        progress=progress,
+    )
+    df_labeled = run_stage(
+        "labeling",
+        label_changed_clusters,
+        df_clustered,
+        embeddings,
+        centers,
+        relabel,
+        progress=progress,
+        force_refresh=refresh_labels,
+    )
+    df_labeled = run_stage(
+        "sentiment",
+        assign_cluster_sentiment,
+        df_labeled,
+        positive_intent,
+        negative_intent,
+    )
+
+    def combined(key, new):
+        # Keywords uploaded again keep their first (previous) row
+        old = previous.get(key)
+        if old is None or old.empty:
+            return new
+        if "Keyword" in new.columns and "Keyword" in old.columns:
+            new = new[~new["Keyword"].isin(old["Keyword"])]
+        return pd.concat([old, new], ignore_index=True)
+
+    previous_clean = previous.get("final_clean_df")
+    previous_rows = 0 if previous_clean is None else len(previous_clean)
+    final_clean_df = combined("final_clean_df", df_cleaned)
+    repeated = previous_rows + len(df_cleaned) - len(final_clean_df)
+    return {
+        "final_clean_df": final_clean_df,
+        "removed_questions": combined("removed_questions", df_removed_questions),
+        "removed_patterns": combined("removed_patterns", df_removed_patterns),
+        "final_df": df_labeled,
+        "misc_keywords": df_misc,
+        "expected_count": previous.get("expected_count", 0) + expected - repeated,
+    }
+
+
+def report_frames(results):
+    """Sheets for ``export_data_to_excel`` in the order the app exports them."""
+    return {
+        "Final_Clustered_Keywords": results["final_df"],
+        "Removed_Questions": results.get("removed_questions", pd.DataFrame()),
+        "Removed_Patterns": results.get("removed_patterns", pd.DataFrame()),
+        "Cleaned_Keywords": results.get("final_clean_df", pd.DataFrame()),
+    }
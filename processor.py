@@ -1,55 +1,221 @@
+import csv
 import re
 import os
+import time
 import warnings
+import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
-from models import load_question_classifier, load_embedding_model
+from models import (
+    load_question_classifier,
+    load_embedding_model,
+    EMBEDDING_MODEL_NAME,
+)
+from embedding_cache import encode_with_cache
+from clustering import size_constrained_clusters, reassign_to_groups
+from pattern_filter import build_matcher
+from normalize import canonical_groups
+import workers
+from metrics import instrument
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
 
-def load_and_clean_file(file_path):
+COLUMNS_TO_DROP = [
+    "Three month change", "YoY change", "Competition",
+    "Competition (indexed value)", "Ad impression share",
+    "Organic impression share", "Organic average position", "In account?",
+    "In plan?", "Searches: May 2024", "Searches: Jun 2024", "Searches: Jul 2024",
+    "Searches: Aug 2024", "Searches: Sep 2024", "Searches: Oct 2024",
+    "Searches: Nov 2024", "Searches: Dec 2024", "Searches: Jan 2025",
+    "Searches: Feb 2025", "Searches: Mar 2025", "Searches: Apr 2025", "Searches: May 2025",
+]
+# Bookkeeping columns added by the filters, not carried into the groups
+PIPELINE_COLUMNS = ["is_question", "question_score", "Removed_By", "TempCluster"]
+# Low-cardinality text columns that compress well as categoricals
+CATEGORICAL_COLUMNS = ["Currency", "Competition", "In account?", "In plan?"]
+SNIFF_BYTES = 64 * 1024
+
+
+def _read_head(file_path):
+    if hasattr(file_path, "read"):
+        position = file_path.tell()
+        head = file_path.read(SNIFF_BYTES)
+        file_path.seek(position)
+        return head if isinstance(head, bytes) else head.encode("utf-8")
+    with open(file_path, "rb") as f:
+        return f.read(SNIFF_BYTES)
+
+
+def sniff_csv_layout(file_path):
+    """Work out encoding, delimiter, banner rows and header of a CSV export.
+
+    Keyword Planner writes UTF-16 tab-separated files with a couple of title
+    lines above the header; plain UTF-8 comma-separated files also work.
+    """
+    head = _read_head(file_path)
+    if head.startswith((b"\xff\xfe", b"\xfe\xff")):
+        encoding = "utf-16"
+    else:
+        encoding = "utf-8-sig"
+    text = head.decode(encoding, errors="ignore")
+    lines = text.splitlines()
+    skiprows, has_keyword = 0, False
+    for i, line in enumerate(lines):
+        fields = re.split(r"[\t,]", line)
+        if "Keyword" in (f.strip().strip('"') for f in fields):
+            skiprows, has_keyword = i, True
+            break
+    header_line = lines[skiprows] if lines else ""
+    sep = "\t" if header_line.count("\t") > header_line.count(",") else ","
+    # Raw names as pandas will see them: unquoted but not stripped
+    columns = next(csv.reader([header_line], delimiter=sep), [])
+    return {
+        "encoding": encoding,
+        "sep": sep,
+        "skiprows": skiprows,
+        "columns": columns,
+        "has_keyword": has_keyword,
+    }
+
+
+def _read_options(file_path, engine):
+    layout = sniff_csv_layout(file_path)
+    keep = []
+    # Without a recognisable header, read every column rather than guess
+    if layout["has_keyword"]:
+        keep = [
+            c
+            for c in layout["columns"]
+            if c.strip() and c.strip() not in COLUMNS_TO_DROP
+        ]
+    options = {
+        "encoding": layout["encoding"],
+        "sep": layout["sep"],
+        "skiprows": layout["skiprows"],
+        "usecols": keep or None,
+        "dtype": {c: "category" for c in keep if c.strip() in CATEGORICAL_COLUMNS},
+    }
+    if engine == "pyarrow":
+        try:
+            import pyarrow  # noqa: F401
+
+            options["engine"] = "pyarrow"
+        except ImportError:
+            print("⚠️ pyarrow not installed, falling back to the C parser.")
+    return options
+
+
+def _compact_dtypes(df):
+    for col in df.columns:
+        if col == "Keyword":
+            continue
+        # Floats (bids) stay float64 so exported values are not perturbed
+        if pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+        elif df[col].dtype == object and df[col].nunique() <= max(1, len(df) // 2):
+            df[col] = df[col].astype("category")
+    return df
+
+
+@instrument("load")
+def load_and_clean_file(file_path, engine="c"):
     try:
-        df = pd.read_csv(file_path)
+        options = _read_options(file_path, engine)
+        df = pd.read_csv(file_path, **options)
+        df.columns = [str(c).strip() for c in df.columns]
         print("✅ File loaded successfully!")
     except Exception as e:
         print(f"⚠️ Error: {e}")
         return None
-    columns_to_drop = [
-        "Three month change", "YoY change", "Competition",
-        "Competition (indexed value)", "Ad impression share",
-        "Organic impression share", "Organic average position", "In account?",
-        "In plan?", "Searches: May 2024", "Searches: Jun 2024", "Searches: Jul 2024",
-        "Searches: Aug 2024", "Searches: Sep 2024", "Searches: Oct 2024",
-        "Searches: Nov 2024", "Searches: Dec 2024", "Searches: Jan 2025",
-        "Searches: Feb 2025", "Searches: Mar 2025", "Searches: Apr 2025", "Searches: May 2025",
-    ]
-    df.drop(columns=[col for col in columns_to_drop if col in df.columns],
-            inplace=True, errors="ignore")
-    return df
+    return _compact_dtypes(df)
 
-def filter_questions(df: pd.DataFrame) -> tuple:
-    classifier = load_question_classifier()
-    df["is_question"] = df["Keyword"].apply(
-        lambda x: max(classifier(x)[0], key=lambda y: y["score"])["label"]
-    )
-    df["is_question"] = df["is_question"].apply(
-        lambda x: "Ques" if x == "LABEL_1" else "Not Ques"
+
+def iter_keyword_batches(file_path, chunksize=100_000, engine="c"):
+    """Yield the cleaned file in DataFrames of at most ``chunksize`` rows.
+
+    Uses the same column pruning and dtypes as ``load_and_clean_file``, so
+    only one batch of the file is parsed and held at a time.
+    """
+    options = _read_options(file_path, engine)
+    # The pyarrow parser cannot read in chunks
+    options.pop("engine", None)
+    for chunk in pd.read_csv(file_path, chunksize=chunksize, **options):
+        chunk.columns = [str(c).strip() for c in chunk.columns]
+        yield _compact_dtypes(chunk)
+
+
+QUESTION_STARTERS = {
+    "can", "could", "do", "does", "did", "what", "how", "where", "why", "who",
+    "will", "shall", "is", "are", "was", "were", "would", "should", "if",
+    "may", "might", "must", "tell me", "explain", "describe"
+}
+
+
+def classify_questions(
+    keywords, classifier=None, batch_size=64, max_length=32, progress=None
+):
+    """Run the question classifier over ``keywords`` in length-sorted batches.
+
+    Returns ``(labels, scores)`` arrays aligned with the input order, holding
+    the top label and its score for every keyword. Large inputs go to the
+    worker pool when ``KEYWORD_WORKERS`` is set (see ``workers``).
+    """
+    texts = ["" if pd.isna(k) else str(k) for k in keywords]
+    if classifier is None and workers.sharding_enabled(len(texts)):
+        return workers.classify_sharded(texts, batch_size, max_length, progress)
+    if classifier is None:
+        classifier = load_question_classifier()
+    labels = np.empty(len(texts), dtype=object)
+    scores = np.zeros(len(texts), dtype=np.float32)
+
+    # Sorting by length keeps padding inside each batch to a minimum
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    for start in range(0, len(texts), batch_size):
+        idx = order[start: start + batch_size]
+        outputs = classifier(
+            [texts[i] for i in idx],
+            batch_size=batch_size,
+            truncation=True,
+            max_length=max_length,
+        )
+        for i, out in zip(idx, outputs):
+            best = max(out, key=lambda y: y["score"])
+            labels[i] = best["label"]
+            scores[i] = best["score"]
+    return labels, scores
+
+
+@instrument("question_filter")
+def filter_questions(
+    df: pd.DataFrame, batch_size=64, max_length=32, progress=None
+) -> tuple:
+    # Classify each canonical form once and broadcast back to its rows. The
+    # model sees the form's first original keyword, not the canonical string,
+    # which has lost the "?" and plural endings the classifier relies on
+    _, inverse = canonical_groups(df)
+    _, first_rows = np.unique(inverse, return_index=True)
+    labels, scores = classify_questions(
+        df["Keyword"].to_numpy()[first_rows],
+        batch_size=batch_size,
+        max_length=max_length,
+        progress=progress,
     )
+    df["is_question"] = np.where(labels[inverse] == "LABEL_1", "Ques", "Not Ques")
+    df["question_score"] = scores[inverse]
     df_removed_classifier = df[df["is_question"] == "Ques"].copy()
+    df_removed_classifier["Removed_By"] = "question classifier"
     df_remaining = df[df["is_question"] != "Ques"].copy()
 
-    # Extended set of question starters
-    question_starters = {
-        "can", "could", "do", "does", "did", "what", "how", "where", "why", "who",
-        "will", "shall", "is", "are", "was", "were", "would", "should", "if",
-        "may", "might", "must", "tell me", "explain", "describe"
-    }
-    pattern = r"^(" + "|".join(re.escape(word) for word in question_starters) + r")\b"
-    df_removed_manual = df_remaining[
-        df_remaining["Keyword"].str.strip().str.lower().str.match(pattern)
-    ].copy()
+    # Only rows the model kept are checked for question starters
+    starters = build_matcher(sorted(QUESTION_STARTERS), mode="prefix")
+    rules = pd.Series(
+        starters.match_many(df_remaining["Keyword"].tolist()),
+        index=df_remaining.index,
+        dtype=object,
+    )
+    df_removed_manual = df_remaining[rules.notna()].copy()
     df_removed_manual["is_question"] = "Ques"
+    df_removed_manual["Removed_By"] = "starter: " + rules[rules.notna()]
     df_final_filtered = df_remaining.drop(df_removed_manual.index)
 
     df_removed_total = pd.concat(
@@ -58,46 +224,181 @@ def filter_questions(df: pd.DataFrame) -> tuple:
     return df_final_filtered, df_removed_total
 
 
-def filter_patterns(df: pd.DataFrame, words_to_filter: list) -> tuple:
-    if not words_to_filter:
+@instrument("pattern_filter")
+def filter_patterns(
+    df: pd.DataFrame, words_to_filter: list, mode="substring"
+) -> tuple:
+    words = [w.strip() for w in words_to_filter if w.strip()]
+    if not words:
         return df, pd.DataFrame()
-    pattern = "|".join([w.strip() for w in words_to_filter if w.strip()])
-    df_removed = df[df["Keyword"].str.contains(pattern, case=False, na=False)]
+    matcher = build_matcher(words, mode=mode)
+    rules = pd.Series(
+        matcher.match_many(df["Keyword"].tolist()), index=df.index, dtype=object
+    )
+    df_removed = df[rules.notna()].copy()
+    df_removed["Removed_By"] = rules[rules.notna()]
     df_filtered = df.drop(df_removed.index)
     return df_filtered, df_removed
 
-def cluster_keywords(df, min_k, max_k):
-    model = load_embedding_model()
-    keywords = df["Keyword"].tolist()
-    embeddings = model.encode(keywords, show_progress_bar=True)
-    total_keywords = len(keywords)
-    approx_groups = max(1, total_keywords // max_k)
-    kmeans = KMeans(n_clusters=approx_groups * 2, random_state=42)
-    labels = kmeans.fit_predict(embeddings)
-    df["TempCluster"] = labels
-
-    final_groups = []
-    misc_group = []
-
-    for _, group_df in df.groupby("TempCluster"):
-        keyword_list = group_df["Keyword"].tolist()
-        if len(keyword_list) < min_k:
-            misc_group.extend(keyword_list)
-        elif len(keyword_list) > max_k:
-            for i in range(0, len(keyword_list), max_k):
-                chunk = keyword_list[i: i + max_k]
-                if len(chunk) < min_k:
-                    misc_group.extend(chunk)
-                else:
-                    final_groups.append(chunk)
-        else:
-            final_groups.append(keyword_list)
-
-    clustered_data = []
-    for i, group in enumerate(final_groups):
-        for kw in group:
-            clustered_data.append({"Keyword": kw, "Cluster": i})
-
-    df_clustered = pd.DataFrame(clustered_data)
-    df_misc = pd.DataFrame({"Keyword": misc_group})
-    return df_clustered, embeddings, kmeans.cluster_centers_, df_misc
+def embed_texts(texts, progress=None):
+    if workers.sharding_enabled(len(texts)):
+        model = workers.ShardedEncoder(progress)
+    else:
+        model = load_embedding_model()
+    return encode_with_cache(model, texts, EMBEDDING_MODEL_NAME, show_progress_bar=True)
+
+
+@instrument("embedding")
+def embed_keywords(df, progress=None):
+    """Embed each canonical form of ``df`` once, in ``canonical_groups`` order."""
+    unique_forms, _ = canonical_groups(df)
+    return embed_texts(unique_forms, progress)
+
+
+@instrument("clustering")
+def cluster_keywords(df, min_k, max_k, reassign_threshold=0.5, embeddings=None):
+    """Group keywords into clusters of ``min_k..max_k`` distinct keywords.
+
+    Embedding and clustering run once per canonical form; every original row
+    then joins its form's cluster with all of its columns. ``embeddings`` has
+    one row per canonical form and is computed when not supplied.
+    """
+    unique_forms, inverse = canonical_groups(df)
+    if embeddings is None:
+        embeddings = embed_keywords(df)
+    groups, misc_positions = size_constrained_clusters(embeddings, min_k, max_k)
+
+    # Give leftovers a second chance in the nearest group with spare room
+    if reassign_threshold is not None:
+        start = time.time()
+        groups, misc_positions, moved = reassign_to_groups(
+            embeddings, groups, misc_positions, max_k, reassign_threshold
+        )
+        print(
+            f"🧲 Reassigned {moved} misc keywords in {time.time() - start:.2f}s "
+            f"({len(misc_positions)} left in Miscellaneous)"
+        )
+
+    # Row i holds the mean embedding of final group i
+    centers = np.array(
+        [embeddings[positions].mean(axis=0) for positions in groups],
+        dtype=np.float32,
+    ).reshape(len(groups), embeddings.shape[1])
+
+    form_cluster = np.full(len(unique_forms), -1, dtype=np.int64)
+    for i, positions in enumerate(groups):
+        form_cluster[positions] = i
+    row_cluster = form_cluster[inverse]
+
+    df_out = df.drop(columns=PIPELINE_COLUMNS, errors="ignore")
+    clustered = row_cluster >= 0
+    order = np.argsort(row_cluster[clustered], kind="stable")
+    df_clustered = df_out[clustered].iloc[order].reset_index(drop=True)
+    df_clustered["Cluster"] = row_cluster[clustered][order]
+    df_misc = df_out[~clustered].reset_index(drop=True)
+    return df_clustered, embeddings, centers, df_misc
+
+
+@instrument("clustering")
+def cluster_incremental(
+    df,
+    previous_df,
+    min_k,
+    max_k,
+    reassign_threshold=0.5,
+    previous_misc=None,
+    progress=None,
+):
+    """Add new keywords to the groups of a previous run.
+
+    ``previous_df`` is the labeled ``final_df`` of that run. New keywords
+    sharing a canonical form with a grouped one join its group; the rest go
+    to the most similar group that still has room, and only what is left
+    (plus the previous run's Miscellaneous rows) is clustered from scratch
+    into new groups numbered after the old ones. Previous groups keep their
+    ids, rows and labels.
+
+    Returns ``(df_clustered, embeddings, centers, df_misc, relabel)`` where
+    ``centers`` is indexed by cluster id and ``relabel`` lists the ids of
+    new groups and of old groups that gained keywords.
+    """
+    seen = previous_df["Keyword"]
+    if previous_misc is not None and not previous_misc.empty:
+        seen = pd.concat([seen, previous_misc["Keyword"]])
+    df = df[~df["Keyword"].isin(seen)]
+    if previous_misc is not None and not previous_misc.empty:
+        df = pd.concat([previous_misc, df], ignore_index=True)
+    df = df.drop(columns=PIPELINE_COLUMNS, errors="ignore").reset_index(drop=True)
+
+    old_forms, old_inverse = canonical_groups(previous_df)
+    old_form_cluster = (
+        pd.Series(previous_df["Cluster"].to_numpy())
+        .groupby(old_inverse)
+        .first()
+        .to_numpy()
+    )
+    forms, inverse = canonical_groups(df)
+    known = pd.Index(old_forms).get_indexer(forms)
+    fresh = np.flatnonzero(known < 0)
+
+    # Old forms are embedding-cache hits, so only new ones reach the model
+    embeddings = embed_texts(
+        np.concatenate([old_forms, forms[fresh]]), progress=progress
+    )
+    cluster_ids = np.unique(old_form_cluster)
+    groups = [np.flatnonzero(old_form_cluster == c) for c in cluster_ids]
+    old_sizes = [len(g) for g in groups]
+    misc = len(old_forms) + np.arange(len(fresh))
+
+    start = time.time()
+    moved = 0
+    if reassign_threshold is not None:
+        groups, misc, n = reassign_to_groups(
+            embeddings, groups, misc, max_k, reassign_threshold
+        )
+        moved += n
+    if len(misc):
+        new_groups, new_misc = size_constrained_clusters(
+            embeddings[misc], min_k, max_k
+        )
+        groups += [misc[g] for g in new_groups]
+        misc = misc[new_misc]
+    if reassign_threshold is not None:
+        groups, misc, n = reassign_to_groups(
+            embeddings, groups, misc, max_k, reassign_threshold
+        )
+        moved += n
+    next_id = int(cluster_ids.max()) + 1 if len(cluster_ids) else 0
+    group_ids = np.concatenate(
+        [cluster_ids, np.arange(next_id, next_id + len(groups) - len(cluster_ids))]
+    ).astype(np.int64)
+    relabel = [
+        int(c)
+        for i, c in enumerate(group_ids)
+        if i >= len(old_sizes) or len(groups[i]) > old_sizes[i]
+    ]
+    print(
+        f"➕ {len(fresh)} new keyword forms: {moved} joined existing groups, "
+        f"{len(groups) - len(cluster_ids)} new groups, {len(misc)} in "
+        f"Miscellaneous ({time.time() - start:.2f}s)"
+    )
+
+    size = int(group_ids.max()) + 1 if len(group_ids) else 0
+    centers = np.zeros((size, embeddings.shape[1]), dtype=np.float32)
+    position_cluster = np.full(len(embeddings), -1, dtype=np.int64)
+    for cluster_id, positions in zip(group_ids, groups):
+        centers[cluster_id] = embeddings[positions].mean(axis=0)
+        position_cluster[positions] = cluster_id
+
+    form_cluster = np.where(known >= 0, old_form_cluster[np.maximum(known, 0)], -1)
+    form_cluster[fresh] = position_cluster[len(old_forms):]
+    row_cluster = form_cluster[inverse]
+
+    clustered = row_cluster >= 0
+    df_new = df[clustered].copy()
+    df_new["Cluster"] = row_cluster[clustered]
+    df_clustered = pd.concat([previous_df, df_new], ignore_index=True)
+    order = np.argsort(df_clustered["Cluster"].to_numpy(), kind="stable")
+    df_clustered = df_clustered.iloc[order].reset_index(drop=True)
+    df_misc = df[~clustered].reset_index(drop=True)
+    return df_clustered, embeddings, centers, df_misc, relabel
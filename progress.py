@@ -0,0 +1,65 @@
+import json
+import sys
+import time
+
+
+class StreamlitProgress:
+    """Progress bar plus status line in the running Streamlit script."""
+
+    def __init__(self):
+        import streamlit as st
+
+        self.progress_bar = st.progress(0)
+        self.status_text = st.empty()
+
+    def update(self, fraction, message):
+        self.progress_bar.progress(min(max(fraction, 0.0), 1.0))
+        self.status_text.markdown(message)
+
+    def finish(self, message):
+        self.status_text.success(message)
+
+
+class LogProgress:
+    """Headless progress: plain lines on stderr and/or JSON lines in a log."""
+
+    def __init__(
+        self, stage="", stream=sys.stderr, json_log=None, min_interval=1.0
+    ):
+        self.stage = stage
+        self.stream = stream
+        self.json_log = json_log
+        self.min_interval = min_interval
+        self._last = 0.0
+
+    def _emit(self, event, fraction, message):
+        # Messages are written for Streamlit markdown; flatten them for logs
+        message = message.replace("&nbsp;", " ").replace("`", "")
+        if self.stream is not None:
+            self.stream.write(f"[{self.stage}] {message}\n")
+            self.stream.flush()
+        if self.json_log is not None:
+            self.json_log.write(
+                json.dumps(
+                    {
+                        "time": time.time(),
+                        "stage": self.stage,
+                        "event": event,
+                        "fraction": fraction,
+                        "message": message,
+                    },
+                    ensure_ascii=False,
+                )
+                + "\n"
+            )
+            self.json_log.flush()
+
+    def update(self, fraction, message):
+        now = time.monotonic()
+        if fraction < 1.0 and now - self._last < self.min_interval:
+            return
+        self._last = now
+        self._emit("progress", fraction, message)
+
+    def finish(self, message):
+        self._emit("done", 1.0, message)
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from stage_cache import fingerprint
+from utils import export_data, EXPORT_FORMATS
+
+# Reports with more rows than this are written to a temp file, not memory
+SPILL_ROWS = int(os.environ.get("REPORT_SPILL_ROWS", 200_000))
+MAX_REPORTS = 16
+
+REPORT_DOWNLOADS = {
+    "xlsx": (
+        "keyword_intelligence.xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+    "parquet": ("keyword_intelligence_parquet.zip", "application/zip"),
+    "csv.zip": ("keyword_intelligence_csv.zip", "application/zip"),
+}
+# Formats whose optional writer is not installed are not offered
+REPORT_DOWNLOADS = {f: REPORT_DOWNLOADS[f] for f in EXPORT_FORMATS}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="report")
+_reports = OrderedDict()
+_reports_lock = threading.Lock()
+
+
+def _total_rows(dfs_dict, misc_df):
+    frames = list(dfs_dict.values()) + [misc_df]
+    return sum(len(df) for df in frames if df is not None)
+
+
+def _build_report(dfs_dict, max_k, misc_df, fmt):
+    if _total_rows(dfs_dict, misc_df) > SPILL_ROWS:
+        fd, path = tempfile.mkstemp(prefix="keyword_report_", suffix=f".{fmt}")
+        os.close(fd)
+        export_data(dfs_dict, fmt=fmt, max_k=max_k, misc_df=misc_df, output=path)
+        return {"path": path}
+    buffer = export_data(dfs_dict, fmt=fmt, max_k=max_k, misc_df=misc_df)
+    return {"data": buffer.getvalue()}
+
+
+def _remove_spilled(future):
+    if future.cancelled() or future.exception():
+        return
+    path = future.result().get("path")
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def _discard(future):
+    # Remove spilled files of reports that fell out of the memo; a build
+    # that is still running removes its file as soon as it finishes
+    future.add_done_callback(_remove_spilled)
+
+
+def report_key(dfs_dict, max_k, misc_df, fmt="xlsx"):
+    return fingerprint(dfs_dict, max_k, misc_df, fmt)
+
+
+def request_report(dfs_dict, max_k, misc_df, fmt="xlsx"):
+    """Start (or reuse) a background build and return ``(key, future)``.
+
+    Builds are memoized on a content hash of the frames, ``max_k`` and the
+    format (see ``utils.EXPORT_FORMATS``), so asking twice for the same
+    data never rebuilds the report.
+    """
+    key = report_key(dfs_dict, max_k, misc_df, fmt)
+    with _reports_lock:
+        future = _reports.get(key)
+        if future is None or (future.done() and future.exception()):
+            future = _executor.submit(
+                _build_report, dfs_dict, max_k, misc_df, fmt
+            )
+            _reports[key] = future
+        _reports.move_to_end(key)
+        while len(_reports) > MAX_REPORTS:
+            _, old = _reports.popitem(last=False)
+            _discard(old)
+    return key, future
+
+
+def get_report(key):
+    """Return the future for a previously requested report, if still held."""
+    with _reports_lock:
+        return _reports.get(key)
+
+
+def open_report(result):
+    """Data suitable for ``st.download_button`` from a finished build."""
+    if "data" in result:
+        return result["data"]
+    with open(result["path"], "rb") as f:
+        return f.read()
@@ -1,27 +1,47 @@
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+from models import load_embedding_model, EMBEDDING_MODEL_NAME
+from embedding_cache import encode_with_cache
+from metrics import instrument
+from clustering import normalize_rows
 
 
+@instrument("sentiment")
 def assign_cluster_sentiment(
     df, positive_definition: str, negative_definition: str, threshold=0.05
 ):
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    pos_vec = model.encode([positive_definition])[0].reshape(1, -1)
-    neg_vec = model.encode([negative_definition])[0].reshape(1, -1)
+    if df.empty:
+        df["Cluster_Sentiment"] = []
+        df["Sentiment_Score"] = []
+        return df
 
-    sentiments = []
-    for desc in df["Intent_Description"]:
-        if desc == "N/A":
-            sentiments.append("Negative")
-            continue
-        desc_vec = model.encode([desc])[0].reshape(1, -1)
-        pos_sim = cosine_similarity(desc_vec, pos_vec)[0][0]
-        neg_sim = cosine_similarity(desc_vec, neg_vec)[0][0]
+    model = load_embedding_model()
+    definitions = normalize_rows(
+        encode_with_cache(
+            model, [positive_definition, negative_definition], EMBEDDING_MODEL_NAME
+        )
+    )
 
-        if abs(pos_sim - neg_sim) < threshold:
-            sentiments.append("Positive")  # Treat borderline neutral as Positive
-        else:
-            sentiments.append("Positive" if pos_sim > neg_sim else "Negative")
+    # Every keyword in a cluster shares its description, so score each once
+    per_cluster = df.drop_duplicates("Cluster")[["Cluster", "Intent_Description"]]
+    descriptions = per_cluster["Intent_Description"].fillna("N/A").astype(str)
+    unique_desc = descriptions.unique()
+    desc_vecs = normalize_rows(
+        encode_with_cache(model, unique_desc, EMBEDDING_MODEL_NAME, batch_size=256)
+    )
+    sims = desc_vecs @ definitions.T
+    score_by_desc = dict(zip(unique_desc, sims[:, 0] - sims[:, 1]))
 
-    df["Cluster_Sentiment"] = sentiments
+    scores = descriptions.map(score_by_desc).to_numpy(dtype=np.float32)
+    # Borderline neutral (|pos - neg| < threshold) is treated as Positive
+    sentiments = np.where(
+        (np.abs(scores) < threshold) | (scores > 0), "Positive", "Negative"
+    )
+    sentiments = np.where(descriptions.to_numpy() == "N/A", "Negative", sentiments)
+
+    df["Cluster_Sentiment"] = df["Cluster"].map(
+        dict(zip(per_cluster["Cluster"], sentiments))
+    )
+    df["Sentiment_Score"] = df["Cluster"].map(
+        dict(zip(per_cluster["Cluster"], scores))
+    )
     return df
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+DEFAULT_MAX_MB = float(os.environ.get("STAGE_CACHE_MAX_MB", 1024))
+
+# Keyword arguments that affect reporting only, never the result
+UNHASHED_KWARGS = {"progress"}
+
+
+def _update_digest(digest, value):
+    if isinstance(value, pd.DataFrame):
+        digest.update(b"df")
+        digest.update(repr(list(value.columns)).encode("utf-8"))
+        digest.update(repr([str(t) for t in value.dtypes]).encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, pd.Series):
+        digest.update(b"series")
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(b"nd")
+        digest.update(repr((value.dtype.str, value.shape)).encode("utf-8"))
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"seq{len(value)}".encode("utf-8"))
+        for item in value:
+            _update_digest(digest, item)
+    elif isinstance(value, dict):
+        digest.update(f"map{len(value)}".encode("utf-8"))
+        for key in sorted(value, key=repr):
+            _update_digest(digest, key)
+            _update_digest(digest, value[key])
+    else:
+        digest.update(pickle.dumps(value, protocol=4))
+
+
+def fingerprint(*values):
+    """Stable content hash of DataFrames, arrays and plain Python values."""
+    digest = hashlib.blake2b(digest_size=20)
+    for value in values:
+        _update_digest(digest, value)
+    return digest.hexdigest()
+
+
+def _copy(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy(v) for v in value)
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _size_bytes(value):
+    # deep=True counts the strings behind object columns, which are most of
+    # a keyword frame; it is computed once per entry when it is stored
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return _size_bytes(pd.Series(value, copy=False))
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_size_bytes(v) for v in value)
+    return 0
+
+
+class StageCache:
+    """Bounded LRU of pipeline stage results keyed on a hash of their inputs.
+
+    Keep one instance per user session (e.g. in ``st.session_state``) so
+    results never leak between users. Inputs and results are copied on the
+    way in and out because stages mutate the frames they are given.
+    """
+
+    def __init__(self, max_mb=DEFAULT_MAX_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.last_run = {}
+        # Background jobs of one session may share the cache; the lock
+        # guards the entries only, never a running stage
+        self._lock = threading.Lock()
+
+    def run(self, name, fn, *args, **kwargs):
+        hashed_kwargs = {
+            k: v for k, v in kwargs.items() if k not in UNHASHED_KWARGS
+        }
+        key = (name, fingerprint(fn.__name__, args, hashed_kwargs))
+        # A forced refresh recomputes the stage and replaces the entry
+        if not kwargs.get("force_refresh"):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.last_run[name] = "hit"
+            if entry is not None:
+                metrics.record("stage_cache_hits")
+                return _copy(entry[0])
+
+        result = fn(*[_copy(a) for a in args], **kwargs)
+        size = _size_bytes(result)
+        stored = _copy(result) if size <= self.max_bytes else None
+        with self._lock:
+            self.last_run[name] = "miss"
+            if stored is not None:
+                if key in self._entries:
+                    self._bytes -= self._entries.pop(key)[1]
+                self._entries[key] = (stored, size)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self._bytes -= evicted
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.last_run = {}
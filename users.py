@@ -87,7 +87,12 @@ def logout():
             "original_df",
             "removed_questions",
             "removed_patterns",
+            "stage_cache",
+            "job_id",
+            "loaded_job",
+            "job_stages",
         ]:
             st.session_state.pop(key, None)
+        st.query_params.clear()
         st.success("👋 Logged out successfully.")
         st.rerun()
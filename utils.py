@@ -1,10 +1,18 @@
 import io
+import datetime
+import importlib.util
+import zipfile
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import streamlit as st
+import xlsxwriter
+from normalize import CANONICAL_COLUMN
+from metrics import instrument
 
 
 def plot_intent_distribution(df):
+    import matplotlib.pyplot as plt
+    import streamlit as st
+
     intent_counts = df["Intent_Type"].value_counts()
     plt.style.use("ggplot")
     fig, ax = plt.subplots(figsize=(12, 8))
@@ -33,74 +41,168 @@ def plot_intent_distribution(df):
     st.pyplot(fig)
 
 
-def export_data_to_excel(dfs_dict: dict, file_name="keyword_intelligence.xlsx"):
-    buffer = io.BytesIO()
-    max_k = st.session_state.get("max_keywords_per_group", 100)
+EXCEL_MAX_ROWS = 1_048_576
+WRITE_CHUNK_ROWS = 10_000
+# Parquet needs pyarrow or fastparquet, which are optional; without either
+# the format is not offered. find_spec checks without importing them.
+PARQUET_AVAILABLE = any(
+    importlib.util.find_spec(engine) for engine in ("pyarrow", "fastparquet")
+)
+EXPORT_FORMATS = ("xlsx",) + (("parquet",) if PARQUET_AVAILABLE else ()) + ("csv.zip",)
+HIDDEN_COLUMNS = ["Cluster", CANONICAL_COLUMN]
+
+
+def _cell(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, (pd.Timestamp, datetime.date)):
+        return str(value)
+    return value
+
+
+def _export_columns(df):
+    return [c for c in df.columns if c not in HIDDEN_COLUMNS]
+
+
+@instrument("export")
+def export_data_to_excel(
+    dfs_dict: dict,
+    file_name="keyword_intelligence.xlsx",
+    max_k=None,
+    misc_df=None,
+    output=None,
+):
+    # Outside an explicit call (the Streamlit app) fall back to session state
+    if max_k is None or misc_df is None:
+        import streamlit as st
+
+        if max_k is None:
+            max_k = st.session_state.get("max_keywords_per_group", 100)
+        if misc_df is None:
+            misc_df = st.session_state.get("misc_keywords")
+    # ``output`` may be a file path or binary file; default is in memory
+    buffer = io.BytesIO() if output is None else output
     used_sheet_names = set()
 
-    def get_unique_sheet_name(base_name):
+    def get_unique_sheet_name(base_name, suffix=""):
+        # Truncate before adding suffixes so they survive the 31-char limit
         name = (
             base_name.strip()
             .replace("/", "-")
             .replace("\\", "-")
             .replace(" ", "_")[:25]
         )
+        name = name[: 31 - len(suffix)] + suffix
         safe_name = name
         i = 1
         while safe_name.lower() in used_sheet_names:
-            safe_name = f"{name}_{i}"
+            tag = f"_{i}"
+            safe_name = f"{name[: 31 - len(tag)]}{tag}"
             i += 1
         used_sheet_names.add(safe_name.lower())
-        return safe_name[:31]
-
-    def drop_cluster_column(df):
-        return df.drop(columns=["Cluster"], errors="ignore")
-
-    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-        for sheet_name, df in dfs_dict.items():
-            if df is not None and not df.empty:
-                safe_name = get_unique_sheet_name(sheet_name)
-                df_to_export = drop_cluster_column(df.copy())
-                df_to_export.to_excel(writer, sheet_name=safe_name, index=False)
-
-        final_df = dfs_dict.get("Final_Clustered_Keywords")
-        if final_df is not None and "Intent_Type" in final_df.columns:
-            for intent_type, group_df in final_df.groupby("Intent_Type"):
-                chunks = [
-                    group_df[i : i + max_k] for i in range(0, len(group_df), max_k)
-                ]
-                for idx, chunk in enumerate(chunks):
-                    base = intent_type if idx == 0 else f"{intent_type}_{idx}"
-                    safe_sheet = get_unique_sheet_name(base)
-                    chunk = drop_cluster_column(chunk.copy())
-                    chunk.to_excel(writer, sheet_name=safe_sheet, index=False)
-
-        if final_df is not None and "Cluster_Sentiment" in final_df.columns:
-            pos_clusters = final_df[final_df["Cluster_Sentiment"] == "Positive"]
-            neg_clusters = final_df[final_df["Cluster_Sentiment"] == "Negative"]
-            if not pos_clusters.empty:
-                pos_clusters = drop_cluster_column(pos_clusters.copy())
-                pos_clusters.to_excel(
-                    writer,
-                    sheet_name=get_unique_sheet_name("Cluster_Positive"),
-                    index=False,
-                )
-            if not neg_clusters.empty:
-                neg_clusters = drop_cluster_column(neg_clusters.copy())
-                neg_clusters.to_excel(
-                    writer,
-                    sheet_name=get_unique_sheet_name("Cluster_Negative"),
-                    index=False,
-                )
-
-        misc_df = st.session_state.get("misc_keywords")
-        if misc_df is not None and not misc_df.empty:
-            misc_df = drop_cluster_column(misc_df.copy())
-            misc_df.to_excel(
-                writer,
-                sheet_name=get_unique_sheet_name("Miscellaneous_Keywords"),
-                index=False,
-            )
-
-    buffer.seek(0)
+        return safe_name
+
+    # constant_memory flushes each row to disk as it is written, so rows are
+    # streamed straight from the source frames without intermediate copies
+    workbook = xlsxwriter.Workbook(buffer, {"constant_memory": True})
+    header_format = workbook.add_format(
+        {"bold": True, "border": 1, "align": "center", "valign": "top"}
+    )
+
+    def write_sheet(base_name, df, positions=None):
+        if positions is None:
+            positions = np.arange(len(df))
+        columns = _export_columns(df)
+        series = [df[c] for c in columns]
+        rows_per_sheet = EXCEL_MAX_ROWS - 1
+        # Anything past Excel's row limit continues on "<name>_partN" sheets
+        for part, sheet_start in enumerate(range(0, len(positions), rows_per_sheet)):
+            suffix = "" if part == 0 else f"_part{part + 1}"
+            worksheet = workbook.add_worksheet(get_unique_sheet_name(base_name, suffix))
+            worksheet.write_row(0, 0, columns, header_format)
+            sheet_positions = positions[sheet_start: sheet_start + rows_per_sheet]
+            row_number = 1
+            for start in range(0, len(sheet_positions), WRITE_CHUNK_ROWS):
+                chunk = sheet_positions[start: start + WRITE_CHUNK_ROWS]
+                values = [s.iloc[chunk].tolist() for s in series]
+                for row in zip(*values):
+                    worksheet.write_row(row_number, 0, [_cell(v) for v in row])
+                    row_number += 1
+
+    for sheet_name, df in dfs_dict.items():
+        if df is not None and not df.empty:
+            write_sheet(sheet_name, df)
+
+    final_df = dfs_dict.get("Final_Clustered_Keywords")
+    if final_df is not None and "Intent_Type" in final_df.columns:
+        for intent_type, positions in sorted(
+            final_df.groupby("Intent_Type", observed=True).indices.items()
+        ):
+            for idx, i in enumerate(range(0, len(positions), max_k)):
+                base = intent_type if idx == 0 else f"{intent_type}_{idx}"
+                write_sheet(str(base), final_df, positions[i: i + max_k])
+
+    if final_df is not None and "Cluster_Sentiment" in final_df.columns:
+        sentiment = final_df["Cluster_Sentiment"].to_numpy()
+        for label in ("Positive", "Negative"):
+            positions = np.flatnonzero(sentiment == label)
+            if len(positions):
+                write_sheet(f"Cluster_{label}", final_df, positions)
+
+    if misc_df is not None and not misc_df.empty:
+        write_sheet("Miscellaneous_Keywords", misc_df)
+
+    workbook.close()
+    if hasattr(buffer, "seek"):
+        buffer.seek(0)
     return buffer
+
+
+@instrument("export")
+def export_data_to_zip(dfs_dict: dict, misc_df=None, fmt="csv.zip", output=None):
+    """Write each frame as a CSV or Parquet member of one zip archive.
+
+    Meant for downstream systems, so there are no per-intent splits or row
+    limits; hidden helper columns are dropped as in the Excel report.
+    """
+    buffer = io.BytesIO() if output is None else output
+    frames = dict(dfs_dict)
+    if misc_df is not None:
+        frames["Miscellaneous_Keywords"] = misc_df
+    compression = zipfile.ZIP_DEFLATED if fmt == "csv.zip" else zipfile.ZIP_STORED
+    with zipfile.ZipFile(buffer, "w", compression=compression) as archive:
+        for name, df in frames.items():
+            if df is None or df.empty:
+                continue
+            columns = _export_columns(df)
+            if fmt == "parquet":
+                # Parquet writers need a seekable target, which zip members are not
+                data = io.BytesIO()
+                df[columns].to_parquet(data, index=False)
+                archive.writestr(f"{name}.parquet", data.getvalue())
+            else:
+                with archive.open(f"{name}.csv", "w") as member:
+                    text = io.TextIOWrapper(member, encoding="utf-8", newline="")
+                    df.to_csv(
+                        text, columns=columns, index=False, chunksize=WRITE_CHUNK_ROWS
+                    )
+                    text.flush()
+                    text.detach()
+    if hasattr(buffer, "seek"):
+        buffer.seek(0)
+    return buffer
+
+
+def export_data(dfs_dict: dict, fmt="xlsx", max_k=None, misc_df=None, output=None):
+    """Export in one of ``EXPORT_FORMATS``; returns the buffer or ``output``."""
+    if fmt == "xlsx":
+        return export_data_to_excel(
+            dfs_dict, max_k=max_k, misc_df=misc_df, output=output
+        )
+    if fmt in ("parquet", "csv.zip"):
+        return export_data_to_zip(dfs_dict, misc_df=misc_df, fmt=fmt, output=output)
+    raise ValueError(f"Unknown export format {fmt!r}; expected one of {EXPORT_FORMATS}")
@@ -0,0 +1,232 @@
+"""Multi-process execution of the question classifier and embedding model.
+
+Texts are cut into chunks and spread over a pool of worker processes,
+each holding its own model copy with intra-op threads pinned to its share
+of the cores. Workers write results straight into shared memory owned by
+the caller, so only chunk offsets and a few label names travel back over
+the pipe.
+
+Set ``KEYWORD_WORKERS`` (or ``--workers`` on the CLI) to the number of
+processes; 0 or 1 keeps inference in the calling process.
+"""
+
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+WORKERS = int(os.environ.get("KEYWORD_WORKERS", 0))
+CHUNK_SIZE = int(os.environ.get("KEYWORD_WORKER_CHUNK", 2048))
+# Smaller inputs are not worth the start-up and pickling overhead
+MIN_SHARDED_ROWS = int(os.environ.get("KEYWORD_WORKER_MIN_ROWS", 5000))
+
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def set_worker_count(n):
+    global WORKERS
+    WORKERS = max(0, int(n))
+
+
+def sharding_enabled(n_rows):
+    return WORKERS > 1 and n_rows >= MIN_SHARDED_ROWS
+
+
+def _init_worker(threads):
+    # Runs in a fresh (spawned) process before torch or onnxruntime load
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "KEYWORD_ONNX_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def get_pool():
+    """Return the process-wide worker pool, starting it on first use."""
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != WORKERS:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            threads = max(1, (os.cpu_count() or 1) // WORKERS)
+            # spawn, not fork: forking a process that already runs torch
+            # threads can deadlock the children
+            _pool = ProcessPoolExecutor(
+                max_workers=WORKERS,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads,),
+            )
+            _pool_size = WORKERS
+            print(f"🧵 Started {WORKERS} inference workers × {threads} threads")
+        return _pool
+
+
+@atexit.register
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _shared_array(shape, dtype):
+    dtype = np.dtype(dtype)
+    size = max(1, int(np.prod(shape)) * dtype.itemsize)
+    shm = SharedMemory(create=True, size=size)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _attach(name):
+    # The caller owns and unlinks the block. On 3.13+ the worker need not
+    # track it; before that, spawned workers share the caller's resource
+    # tracker, where registering it again is harmless
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return SharedMemory(name=name)
+
+
+def _write_shared(name, shape, dtype, start, values):
+    shm = _attach(name)
+    try:
+        out = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        out[start: start + len(values)] = values
+        del out
+    finally:
+        shm.close()
+
+
+def _chunks(n, chunk_size):
+    return [(s, min(s + chunk_size, n)) for s in range(0, n, chunk_size)]
+
+
+def _run_chunks(fn, texts, chunk_args, progress, label):
+    pool = get_pool()
+    spans = _chunks(len(texts), CHUNK_SIZE)
+    futures = {
+        pool.submit(fn, start, texts[start:end], *chunk_args): (start, end)
+        for start, end in spans
+    }
+    results = {}
+    done_rows = 0
+    for future in as_completed(futures):
+        start, end = futures[future]
+        results[start] = future.result()
+        done_rows += end - start
+        if progress is not None:
+            progress.update(
+                done_rows / len(texts),
+                f"{label}: `{done_rows}/{len(texts)}` keywords "
+                f"({len(results)}/{len(spans)} chunks)",
+            )
+    if progress is not None:
+        progress.finish(f"{label}: {len(texts)} keywords on {WORKERS} workers")
+    return results
+
+
+def _embedding_info():
+    from models import load_embedding_model, EMBEDDING_MODEL_NAME
+
+    model = load_embedding_model()
+    dim = np.asarray(model.encode(["probe"], show_progress_bar=False)).shape[1]
+    return dim, getattr(model, "cache_name", EMBEDDING_MODEL_NAME)
+
+
+def _embed_chunk(start, texts, shm_name, shape, batch_size):
+    from models import load_embedding_model
+
+    vectors = load_embedding_model().encode(
+        texts, batch_size=batch_size, show_progress_bar=False
+    )
+    _write_shared(shm_name, shape, np.float32, start, vectors)
+    return len(texts)
+
+
+def _classify_chunk(start, texts, score_name, code_name, n, batch_size, max_length):
+    from models import load_question_classifier
+    from processor import classify_questions
+
+    labels, scores = classify_questions(
+        texts, load_question_classifier(), batch_size, max_length
+    )
+    names, codes = np.unique(labels.astype(str), return_inverse=True)
+    _write_shared(score_name, (n,), np.float32, start, scores)
+    _write_shared(code_name, (n,), np.int16, start, codes)
+    return list(names)
+
+
+class ShardedEncoder:
+    """``encode``-compatible front for the embedding model on the pool.
+
+    Drop it into ``encode_with_cache`` in place of the model; ``cache_name``
+    matches the backend the workers run, so cached vectors are shared.
+    """
+
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.dim, self.cache_name = get_pool().submit(_embedding_info).result()
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, **_):
+        texts = [str(s) for s in sentences]
+        shape = (len(texts), self.dim)
+        shm, out = _shared_array(shape, np.float32)
+        try:
+            _run_chunks(
+                _embed_chunk,
+                texts,
+                (shm.name, shape, batch_size),
+                self.progress,
+                "🧮 Embedding",
+            )
+            return out.copy()
+        finally:
+            del out
+            shm.close()
+            shm.unlink()
+
+
+def classify_sharded(texts, batch_size=64, max_length=32, progress=None):
+    """Sharded ``processor.classify_questions``; returns ``(labels, scores)``."""
+    texts = list(texts)
+    n = len(texts)
+    # Length-sorted chunks keep padding low inside every worker's batches
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    sorted_texts = [texts[i] for i in order]
+    score_shm, scores = _shared_array((n,), np.float32)
+    code_shm, codes = _shared_array((n,), np.int16)
+    try:
+        names_by_chunk = _run_chunks(
+            _classify_chunk,
+            sorted_texts,
+            (score_shm.name, code_shm.name, n, batch_size, max_length),
+            progress,
+            "❓ Question detection",
+        )
+        labels = np.empty(n, dtype=object)
+        sorted_labels = np.empty(n, dtype=object)
+        for start, names in names_by_chunk.items():
+            end = min(start + CHUNK_SIZE, n)
+            sorted_labels[start:end] = np.asarray(names, dtype=object)[
+                codes[start:end]
+            ]
+        labels[order] = sorted_labels
+        out_scores = np.empty(n, dtype=np.float32)
+        out_scores[order] = scores
+        return labels, out_scores
+    finally:
+        del scores, codes
+        for shm in (score_shm, code_shm):
+            shm.close()
+            shm.unlink()